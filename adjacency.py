@@ -0,0 +1,69 @@
+"""
+The adjacency step shared by page_rank.py, page_rank_complete.py and edge_to_adjacency.py:
+builds the nodes ({out_links = [a,b,c], page_rank = pr}) of an edge list (see AdjacencyMixin).
+"""
+
+
+class AdjacencyMixin(object):
+    """
+    Mixin for the page rank jobs (class MRPageRank(AdjacencyMixin, CountersMixin, MRJob)) with --n_nodes:
+    the adjacency step is MRStep(mapper=self.edge_list_mapper, reducer=self.convert_edge_list_to_adjacency_list_reducer)
+    """
+
+    def initial_page_rank(self):
+        """
+        Without --n_nodes, the nodes are only counted while the graph is built. The page ranks then start from 0
+        and the driver of page_rank_complete.py passes all of the mass as dangling mass to the first iteration,
+        which spreads it evenly (see corrected_page_rank): (1 - d) / n + d * (1 / n + 0) = 1 / n
+
+        :return: the page rank of the nodes of a new graph
+        """
+        if self.options.n_nodes is None:
+            return 0.0
+        return 1 / self.options.n_nodes
+
+    def edge_list_mapper(self, source, target):
+        """
+        Emits every edge (node_a, node_b) under node_a, and a placeholder "*" under node_b
+        so that node_b gets to the reducer even if it has no outgoing links (a dangling node).
+
+        Comment lines (starting with "#") of the edge list are skipped.
+
+        :param source: node_a
+        :param target: node_b
+        :return: tuples of (node_a, node_b) and (node_b, "*")
+        """
+        if source.startswith('#'):
+            return
+        yield source, target
+        yield target, "*"
+
+    def convert_edge_list_to_adjacency_list_reducer(self, node_id, values):
+        """
+        Builds the node with adjacency list ({out_links = [a,b,c], page_rank = pr}) from the outgoing edges,
+        keeping every out link once. A node with only "*" placeholders becomes a dangling node (no out links).
+
+        Counts the nodes, edges and dangling nodes of the graph (see CountersMixin.count),
+        which the driver of page_rank_complete.py and edge_to_adjacency.py read.
+
+        :param node_id: the node id which is the key in reduce step
+        :param values: out links of the node and "*" placeholders
+        :return:
+        """
+        n_edges = 0
+        out_links = dict()
+        for value in values:
+            if value != "*":
+                out_links[value] = None
+                n_edges += 1
+
+        node = dict()
+        node['out_links'] = list(out_links)
+        node['page_rank'] = self.initial_page_rank()
+
+        self.count('nodes')
+        self.count('edges', len(node['out_links']))
+        self.count('duplicate edges', n_edges - len(node['out_links']))
+        if not node['out_links']:
+            self.count('dangling nodes')
+        yield node_id, node
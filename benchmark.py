@@ -0,0 +1,215 @@
+"""
+Reproducible benchmark of the MapReduce jobs on synthetic data, runs offline with the inline and local runners.
+
+Generates joke corpora (same CSV format as shortjokes.csv) and edge lists (same format as soc-Epinions1.txt)
+at every scale, runs every job with every runner and writes one JSON object per run:
+    {"job": ..., "runner": ..., "scale": ..., "input_bytes": ..., "wall_time": ..., "peak_rss_kb": ...,
+     "steps": [{"runner_dir": ..., "step": ..., "map_output_records": ..., "map_output_bytes": ...,
+                "shuffle_records": ..., "shuffle_bytes": ...}, ...]}
+
+The jobs run as separate processes (so peak_rss_kb covers the job and its tasks) with --cleanup NONE,
+the records and bytes are counted from the mapper outputs and reducer inputs left in the temp directories.
+page_rank_complete.py runs several jobs, each of them shows up in steps with it's own runner_dir.
+
+Usage:
+    python benchmark.py --scales 1000,10000 --runners inline,local > benchmark.jsonl
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+JOBS = {
+    'bigram_prob_pairs': 'jokes',
+    'bigram_prob_stripes': 'jokes',
+    'page_rank': 'graph',
+    'page_rank_complete': 'graph',
+}
+
+# jokes are word_count words long, drawn from a zipfian vocabulary like natural text
+VOCABULARY_SIZE = 5000
+JOKE_LENGTH = (5, 40)
+# every node links to a few nodes, preferably to the popular ones (like a social network)
+AVERAGE_OUT_DEGREE = 7
+DANGLING_FRACTION = 0.2
+
+
+def generate_jokes(path, n_jokes, seed):
+    """
+    Writes a corpus in the format of shortjokes.csv
+
+    :param path: path of the csv file
+    :param n_jokes: number of jokes
+    :param seed: random seed
+    :return:
+    """
+    rng = random.Random(seed)
+    vocabulary = ['w' + ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(1, 8)))
+                  for _ in range(VOCABULARY_SIZE)]
+    weights = [1 / rank for rank in range(1, VOCABULARY_SIZE + 1)]
+    with open(path, 'w') as f:
+        f.write('ID,Joke\n')
+        for joke_id in range(1, n_jokes + 1):
+            joke = rng.choices(vocabulary, weights, k=rng.randint(*JOKE_LENGTH))
+            f.write('{},"{}."\n'.format(joke_id, ' '.join(joke).capitalize()))
+
+
+def generate_graph(path, n_nodes, seed):
+    """
+    Writes an edge list in the format of soc-Epinions1.txt
+
+    :param path: path of the edge list
+    :param n_nodes: number of nodes
+    :param seed: random seed
+    :return: number of nodes appearing in the edge list
+    """
+    rng = random.Random(seed)
+    weights = [1 / (node + 1) ** 0.8 for node in range(n_nodes)]
+    nodes = set()
+    with open(path, 'w') as f:
+        f.write('# Synthetic directed graph\n# FromNodeId\tToNodeId\n')
+        for source in range(n_nodes):
+            if rng.random() < DANGLING_FRACTION:
+                continue
+            out_degree = rng.randint(1, 2 * AVERAGE_OUT_DEGREE - 1)
+            for target in set(rng.choices(range(n_nodes), weights, k=out_degree)):
+                f.write('{}\t{}\n'.format(source, target))
+                nodes.update((source, target))
+    return len(nodes)
+
+
+def count_lines(paths):
+    """
+    :return: (number of lines, number of bytes) of the files
+    """
+    records = n_bytes = 0
+    for path in paths:
+        with open(path, 'rb') as f:
+            for line in f:
+                records += 1
+                n_bytes += len(line)
+    return records, n_bytes
+
+
+def shuffle_stats(tmp_dir):
+    """
+    Counts the mapper (or combiner) outputs and the reducer inputs of every step of every job run in tmp_dir
+
+    :param tmp_dir: the --local-tmp-dir of the jobs
+    :return: list of dicts, one per step with a reducer
+    """
+    steps = []
+    for step_dir in sorted(glob.glob(os.path.join(tmp_dir, '*', 'step', '*'))):
+        reducer_inputs = glob.glob(os.path.join(step_dir, 'reducer', '*', 'input'))
+        if not reducer_inputs:
+            continue
+        map_outputs = glob.glob(os.path.join(step_dir, 'combiner', '*', 'output')) \
+            or glob.glob(os.path.join(step_dir, 'mapper', '*', 'output'))
+        map_output_records, map_output_bytes = count_lines(map_outputs)
+        shuffle_records, shuffle_bytes = count_lines(reducer_inputs)
+        steps.append({'runner_dir': os.path.basename(os.path.dirname(os.path.dirname(step_dir))),
+                      'step': int(os.path.basename(step_dir)),
+                      'map_output_records': map_output_records,
+                      'map_output_bytes': map_output_bytes,
+                      'shuffle_records': shuffle_records,
+                      'shuffle_bytes': shuffle_bytes})
+    return steps
+
+
+def run_job(job, runner, input_path, job_args, work_dir):
+    """
+    Runs the job as a separate process
+
+    :param job: name of the job script (without .py)
+    :param runner: mrjob runner, inline or local
+    :param input_path: input of the job
+    :param job_args: extra arguments of the job
+    :param work_dir: directory for the temp files and the output
+    :return: dict with the measurements
+    """
+    tmp_dir = os.path.join(work_dir, 'tmp')
+    output_dir = os.path.join(work_dir, 'output')
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), job + '.py')
+    command = [sys.executable, script, input_path, '-r', runner, '--local-tmp-dir', tmp_dir,
+               '--cleanup', 'NONE', '--output-dir', output_dir] + job_args
+
+    start = time.perf_counter()
+    with open(os.path.join(work_dir, 'stderr'), 'wb') as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=stderr)
+        # the resource usage of this process only (and it's tasks), not of the previous runs
+        _, status, usage = os.wait4(process.pid, 0)
+    wall_time = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        with open(os.path.join(work_dir, 'stderr')) as stderr:
+            raise RuntimeError('{} failed:\n{}'.format(' '.join(command), stderr.read()))
+
+    return {'wall_time': wall_time,
+            'peak_rss_kb': usage.ru_maxrss,
+            'steps': shuffle_stats(tmp_dir)}
+
+
+def configure_args():
+    parser = argparse.ArgumentParser(description='Benchmark of the MapReduce jobs on synthetic data')
+    parser.add_argument(
+        '--scales', default='1000,10000',
+        help='Comma separated sizes of the inputs (jokes in a corpus, nodes in a graph)')
+    parser.add_argument(
+        '--runners', default='inline,local', help='Comma separated mrjob runners (inline, local)')
+    parser.add_argument(
+        '--jobs', default=','.join(JOBS), help='Comma separated jobs to run')
+    parser.add_argument(
+        '--n_iterations', type=int, default=5, help='Number of iterations of the page rank jobs')
+    parser.add_argument(
+        '--seed', type=int, default=0, help='Random seed of the synthetic data')
+    parser.add_argument(
+        '--output', default=None, help='File to append the results to (stdout by default)')
+    return parser
+
+
+def main(args=None):
+    options = configure_args().parse_args(args)
+    jobs = options.jobs.split(',')
+    unknown_jobs = set(jobs) - set(JOBS)
+    if unknown_jobs:
+        raise ValueError('Unknown jobs: {}'.format(', '.join(sorted(unknown_jobs))))
+
+    output = open(options.output, 'a') if options.output else sys.stdout
+    data_dir = tempfile.mkdtemp(prefix='benchmark')
+    try:
+        for scale in [int(scale) for scale in options.scales.split(',')]:
+            jokes_path = os.path.join(data_dir, 'jokes_{}.csv'.format(scale))
+            graph_path = os.path.join(data_dir, 'graph_{}.txt'.format(scale))
+            generate_jokes(jokes_path, scale, options.seed)
+            n_nodes = generate_graph(graph_path, scale, options.seed)
+
+            for job in jobs:
+                if JOBS[job] == 'jokes':
+                    input_path, job_args = jokes_path, []
+                else:
+                    input_path = graph_path
+                    job_args = ['--n_iterations', str(options.n_iterations), '--n_nodes', str(n_nodes),
+                                '--top_n', '10']
+                for runner in options.runners.split(','):
+                    work_dir = tempfile.mkdtemp(dir=data_dir)
+                    try:
+                        result = {'job': job, 'runner': runner, 'scale': scale,
+                                  'input_bytes': os.path.getsize(input_path)}
+                        result.update(run_job(job, runner, input_path, job_args, work_dir))
+                    finally:
+                        shutil.rmtree(work_dir)
+                    output.write(json.dumps(result) + '\n')
+                    output.flush()
+    finally:
+        shutil.rmtree(data_dir)
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
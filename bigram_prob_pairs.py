@@ -1,12 +1,64 @@
 from mrjob.job import MRJob, MRStep
-import re
 from collections import defaultdict
-import operator
+from instrumentation import CountersMixin
+from vocabulary import VocabularyMixin
+import heapq
 
 
-class MRWordBigramProb(MRJob):
-    #PARTITIONER = 'org.apache.hadoop.mapred.lib.KeyFieldBasedPartitioner'
+class PairProtocol(object):
+    """
+    Writes the pairs as two separate fields for the shuffle:
+        word<TAB>following_word<TAB>count
+
+    Together with SORT_VALUES (which tells Hadoop that the key is made of the first 2 fields
+    and to partition on the 1st field only) this gives the "order inversion" pattern:
+    - all pairs of a word go to the same reducer, no matter how many reducers there are
+    - the pairs are sorted by word and then following word, "*" sorts before the letters a-z so it comes first
+
+    The local runners split the reducer input on the 1st field and sort whole lines, so they behave the same.
+    The tokenizer only produces the letters a-z (and the vocabulary digits), so the words never contain a tab.
+    """
+
+    def read(self, line):
+        word, following_word, count = line.decode('utf_8').split('\t')
+        return (word, following_word), int(count)
+
+    def write(self, pair, count):
+        return '{}\t{}\t{}'.format(pair[0], pair[1], count).encode('utf_8')
+
+
+class MRWordBigramProb(VocabularyMixin, CountersMixin, MRJob):
     SORT_VALUES = True
+    INTERNAL_PROTOCOL = PairProtocol
+    FILES = ['tokenizer.py', 'vocabulary.py', 'instrumentation.py']
+
+    def configure_args(self):
+        """
+        We configure:
+        - max_pairs - maximal number of pairs held by the "in-mapper" combiner
+        - flush_fraction - fraction of the pairs (least frequent first) flushed once max_pairs is reached
+        - top_k - output only the K most probable following words of every word
+        - min_count - output only the bigrams which occur at least min_count times
+        - vocabulary - shuffle the ids of the words from this vocabulary (see vocabulary.py)
+
+        :return:
+        """
+        super(MRWordBigramProb, self).configure_args()
+        self.add_passthru_arg(
+            '--max_pairs', type=int, default=1000000,
+            help='Maximal number of pairs kept by the in-mapper combiner before flushing')
+        self.add_passthru_arg(
+            '--flush_fraction', type=float, default=1.0,
+            help='Fraction of the pairs flushed when max_pairs is reached, the least frequent pairs are flushed first')
+        self.add_passthru_arg(
+            '--top_k', type=int, default=None,
+            help='Only output the K most probable following words of every word (all of them by default)')
+        self.add_passthru_arg(
+            '--min_count', type=int, default=1,
+            help='Only output the bigrams which occur at least this many times')
+        self.add_file_arg(
+            '--vocabulary', default=None,
+            help='Vocabulary built by vocabulary.py, the shuffle then carries the ids of the words instead of the words')
 
     def mapper_init(self):
         """
@@ -15,6 +67,7 @@ class MRWordBigramProb(MRJob):
         :return:
         """
         self.pair_counts = defaultdict(lambda: 0)
+        self.load_vocabulary()
 
     def mapper(self, joke_id, content):
         """
@@ -28,11 +81,33 @@ class MRWordBigramProb(MRJob):
         :param content: the raw content of the document
         :return: tuple of ((word, following_word),1) or ((word,*))
         """
-        words = re.sub('\s+', ' ', re.sub('[^a-z]+', ' ', re.sub('\'', '', content.lower()))).strip(' ').split(" ")
-        for index, word in enumerate(words):
-            if index < len(words) - 1:
-                self.pair_counts[(word, "*")] += 1  # will be used to calculated the total number of occurrences of the word
-                self.pair_counts[(word, words[index+1])] += 1
+        n_bigrams = 0
+        for word, following_word in self.document_bigrams(content):
+            self.pair_counts[(word, "*")] += 1  # will be used to calculated the total number of occurrences of the word
+            self.pair_counts[(word, following_word)] += 1
+            n_bigrams += 1
+        self.count('in-mapper combiner records in', 2 * n_bigrams)
+
+        if len(self.pair_counts) >= self.options.max_pairs:
+            for pair_count in self.flush_pair_counts():
+                yield pair_count
+
+    def flush_pair_counts(self):
+        """
+        Bounds the memory of the "in-mapper" combiner by yielding the partial counts
+        of the least frequent --flush_fraction of the pairs and forgetting them.
+        The reducer adds up the partial counts, so the pairs can be emitted more than once.
+
+        :return: tuples of ((word, following_word), partial count)
+        """
+        if self.options.flush_fraction >= 1:
+            flushed_pairs = list(self.pair_counts.keys())
+        else:
+            n_flushed = max(1, int(len(self.pair_counts) * self.options.flush_fraction))
+            flushed_pairs = heapq.nsmallest(n_flushed, self.pair_counts, key=self.pair_counts.get)
+        self.count('in-mapper combiner records out', len(flushed_pairs))
+        for pair in flushed_pairs:
+            yield pair, self.pair_counts.pop(pair)
 
     def mapper_final(self):
         """
@@ -40,18 +115,24 @@ class MRWordBigramProb(MRJob):
 
         :return:
         """
+        self.count('in-mapper combiner records out', len(self.pair_counts))
         for pair in self.pair_counts.keys():
             yield pair, self.pair_counts[pair]
 
     def reducer_init(self):
         """
         Keeps state over multiple reduce iterations, very important in order to
-        calculate the "total_word_count" for each 1st word of the bigram
+        calculate the "total_word_count" for each 1st word of the bigram.
+
+        Only the bigrams of the current 1st word are kept as (frequency, decoded following word),
+        they are output once the next word starts. With --top_k, they are kept in a bounded min heap.
 
         :return:
         """
-        self.total_word_count = {}
+        self.word = None
+        self.total_word_count = 0
         self.bigram_frequencies = []
+        self.load_vocabulary()
 
     def reducer(self, pair, counts):
         """
@@ -59,7 +140,7 @@ class MRWordBigramProb(MRJob):
         and sorted by the 2nd key (following word).
         It expects that "*" will be the first following word for every word.
 
-        This is exactly specified in the config.
+        This is exactly what PairProtocol and SORT_VALUES give.
 
         Outputs a triple containing (word, following word, conditional probability).
 
@@ -70,41 +151,53 @@ class MRWordBigramProb(MRJob):
         word = pair[0]
         following_word = pair[1]
         if following_word == "*":
-            self.total_word_count[word] = sum(counts)
+            for bigram in self.output_word():
+                yield bigram
+            self.word = word
+            self.total_word_count = sum(counts)
         else:
-            self.bigram_frequencies.append((word, following_word, (sum(counts) / self.total_word_count[word])))
+            count = sum(counts)
+            if count >= self.options.min_count:
+                # decoded before ranking, so that ties are broken on the words and not on their ids
+                bigram = (count / self.total_word_count, self.decode_word(following_word))
+                if self.options.top_k is None:
+                    self.bigram_frequencies.append(bigram)
+                elif len(self.bigram_frequencies) < self.options.top_k:
+                    heapq.heappush(self.bigram_frequencies, bigram)
+                elif self.options.top_k > 0:
+                    heapq.heappushpop(self.bigram_frequencies, bigram)
 
     def reducer_final(self):
         """
-        Sorts the triples of (word, following word, frequency of the bigram)
-        based word and then frequency of the bigram (word, following word).
-        Outputs sorted values.
+        Outputs the bigrams of the last word
 
         :return:
         """
-        sorted_bigram_frequencies = sorted(self.bigram_frequencies, key=operator.itemgetter(0, 2))
-        for bigram in sorted_bigram_frequencies:
-            yield bigram[0] + "-" + bigram[1], bigram[2]
+        for bigram in self.output_word():
+            yield bigram
+
+    def output_word(self):
+        """
+        Sorts the bigrams of the current word based on the frequency of the bigram (word, following word)
+        and outputs them. The words themselves are already sorted by the shuffle.
+
+        :return:
+        """
+        for frequency, following_word in sorted(self.bigram_frequencies):
+            yield self.decode_word(self.word) + "-" + following_word, frequency
+        self.bigram_frequencies = []
 
     def steps(self):
-        # While these configs make sense, they are not necessary when SORT_VALEUS=True is used
+        # SORT_VALUES sets the KeyFieldBasedPartitioner with 'mapreduce.partition.keypartitioner.options': '-k1,1'
+        # and 'stream.num.map.output.key.fields': 2, see PairProtocol
         #   https://mrjob.readthedocs.io/en/latest/job.html#mrjob.job.MRJob.SORT_VALUES
-        # jobconf = {
-        #     'mapred.output.key.comparator.class': 'org.apache.hadoop.mapred.lib.KeyFieldBasedComparator',
-        #     'mapred.text.key.comparator.options': '-k2r',
-        #     'mapred.text.key.partitioner.options': '-k1',
-        #     'stream.num.map.output.key.fields': 2,
-        #     'stream.map.output.field.separator' : "\t",
-        #     'mapreduce.map.output.key.field.separator': '\t',
-        # }
         return [
             MRStep(mapper_init=self.mapper_init,
                    mapper=self.mapper,
                    mapper_final=self.mapper_final,
                    reducer_init=self.reducer_init,
                    reducer=self.reducer,
-                   reducer_final=self.reducer_final,
-                   # jobconf=jobconf
+                   reducer_final=self.reducer_final
             )
         ]
 
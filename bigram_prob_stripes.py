@@ -1,22 +1,74 @@
 from mrjob.job import MRJob, MRStep
-import re
 from collections import defaultdict, Counter
-import operator
+from instrumentation import CountersMixin
+from vocabulary import VocabularyMixin
+import heapq
 
 
-class MRWordBigramProb(MRJob):
+class StripeProtocol(object):
+    """
+    Compact encoding of a stripe for the shuffle:
+        word<TAB>following_word:count following_word:count ...
+
+    The tokenizer only produces the letters a-z (and the vocabulary digits), so the words never contain the separators.
+    """
+
+    def read(self, line):
+        word, raw_stripe = line.decode('utf_8').split('\t', 1)
+        stripe = {}
+        for entry in raw_stripe.split(' '):
+            following_word, count = entry.split(':')
+            stripe[following_word] = int(count)
+        return word, stripe
+
+    def write(self, word, stripe):
+        raw_stripe = ' '.join('{}:{}'.format(following_word, count) for following_word, count in stripe.items())
+        return '{}\t{}'.format(word, raw_stripe).encode('utf_8')
+
+
+class MRWordBigramProb(VocabularyMixin, CountersMixin, MRJob):
+    FILES = ['tokenizer.py', 'vocabulary.py', 'instrumentation.py']
+    INTERNAL_PROTOCOL = StripeProtocol
+
+    def configure_args(self):
+        """
+        We configure:
+        - max_stripe_entries - maximal number of (word, following word) counts held by the "in-mapper" combiner
+        - top_k - output only the K most probable following words of every word
+        - min_count - output only the bigrams which occur at least min_count times
+        - vocabulary - shuffle the ids of the words from this vocabulary (see vocabulary.py)
+
+        :return:
+        """
+        super(MRWordBigramProb, self).configure_args()
+        self.add_passthru_arg(
+            '--max_stripe_entries', type=int, default=1000000,
+            help='Maximal number of counts kept in the stripes of the in-mapper combiner before flushing')
+        self.add_passthru_arg(
+            '--top_k', type=int, default=None,
+            help='Only output the K most probable following words of every word (all of them by default)')
+        self.add_passthru_arg(
+            '--min_count', type=int, default=1,
+            help='Only output the bigrams which occur at least this many times')
+        self.add_file_arg(
+            '--vocabulary', default=None,
+            help='Vocabulary built by vocabulary.py, the shuffle then carries the ids of the words instead of the words')
+
     def mapper_init(self):
         """
         Initialise the dictionary for "in-mapper" combining
-        where key will be a word and values are a list
+        where key will be a word and values are the stripes (following word -> count)
 
         :return:
         """
-        self.following_words = defaultdict(lambda: [])
+        self.stripes = defaultdict(lambda: defaultdict(int))
+        self.n_stripe_entries = 0
+        self.load_vocabulary()
 
     def mapper(self, joke_id, content):
         """
-        For each encountered word in the text, add a entry to the list of following words.
+        For each encountered word in the text, increments the count of the following word in it's stripe.
+        Once the stripes hold --max_stripe_entries counts, they are flushed.
 
         We ignore the last word in a sentence as it has not following words.
 
@@ -24,38 +76,48 @@ class MRWordBigramProb(MRJob):
         :param content:
         :return:
         """
-        words = re.sub('\s+', ' ', re.sub('[^a-z]+', ' ', re.sub('\'', '', content.lower()))).strip(' ').split(" ")
-        for index, word in enumerate(words):
-            if index < len(words) - 1:
-                self.following_words[word].append(words[index+1])
+        n_bigrams = 0
+        for word, following_word in self.document_bigrams(content):
+            stripe = self.stripes[word]
+            if following_word not in stripe:
+                self.n_stripe_entries += 1
+            stripe[following_word] += 1
+            n_bigrams += 1
+        self.count('in-mapper combiner records in', n_bigrams)
+
+        if self.n_stripe_entries >= self.options.max_stripe_entries:
+            for word_stripe in self.mapper_final():
+                yield word_stripe
 
     def mapper_final(self):
         """
-        Create a "stripe" out of the list of the succeeding words for each word.
-
-        For each word, loops over all the following words (stored in a list) and places them into
-        a dictionary which counts the numbers of their occurrences.
+        Yields the "stripe" of the succeeding words for each word and forgets them.
+        The reducer adds up the stripes, so a word can be emitted more than once.
 
         :return:
         """
-        for word in self.following_words.keys():
-            bigram_count = defaultdict(lambda: 0)
-            for following_word in self.following_words[word]:
-                bigram_count[following_word] += 1
-            yield word, bigram_count
+        self.count('in-mapper combiner records out', len(self.stripes))
+        self.count('stripe entries out', self.n_stripe_entries)
+        for word, stripe in self.stripes.items():
+            yield word, stripe
+        self.stripes.clear()
+        self.n_stripe_entries = 0
 
     def reducer_init(self):
         """
-        Keeps state over multiple reduce iterations, required for sorting the final output
+        Loads the vocabulary to decode the words
 
         :return:
         """
-        self.bigram_frequencies = []
+        self.load_vocabulary()
 
     def reducer(self, word, stripes):
         """
         Adds up the individual stripes from each reducer
-        and then calculates the conditional probability
+        and then calculates the conditional probability.
+
+        Outputs the bigrams of the word sorted by their frequency (only the --top_k most frequent ones),
+        the words themselves are already sorted by the shuffle.
 
         :param word:
         :param stripes:
@@ -65,20 +127,13 @@ class MRWordBigramProb(MRJob):
         for stripe in stripes:
             counts.update(stripe)
         count_total = sum(counts.values())
-        for following_word in counts:
-            self.bigram_frequencies.append((word, following_word, (counts[following_word] / count_total)))
-
-    def reducer_final(self):
-        """
-        Sorts the triples of (word, following word, frequency of the bigram)
-        based word and then frequency of the bigram (word, following word).
-        Outputs sorted values.
-
-        :return:
-        """
-        sorted_bigram_frequencies = sorted(self.bigram_frequencies, key=operator.itemgetter(0, 2))
-        for bigram in sorted_bigram_frequencies:
-            yield bigram[0] + "-" + bigram[1], bigram[2]
+        # decoded before ranking, so that ties are broken on the words and not on their ids
+        bigram_frequencies = [(count / count_total, self.decode_word(following_word))
+                              for following_word, count in counts.items() if count >= self.options.min_count]
+        if self.options.top_k is not None:
+            bigram_frequencies = heapq.nlargest(self.options.top_k, bigram_frequencies)
+        for frequency, following_word in sorted(bigram_frequencies):
+            yield self.decode_word(word) + "-" + following_word, frequency
 
     def steps(self):
         steps = [
@@ -86,8 +141,7 @@ class MRWordBigramProb(MRJob):
                    mapper=self.mapper,
                    mapper_final=self.mapper_final,
                    reducer_init=self.reducer_init,
-                   reducer=self.reducer,
-                   reducer_final=self.reducer_final
+                   reducer=self.reducer
             )
         ]
         return steps
@@ -1,19 +1,78 @@
 """
-the script counts the number of nodes in the input dataset
+Computes the statistics of an edge list (like data/soc-Epinions1.txt) in a single streaming pass:
+the number of nodes, the range of the node ids, the number of (unique) edges and of dangling nodes.
+
+The file is memory mapped and parsed in large chunks, so only the sets of node ids and of edges are held in memory.
+Duplicate lines of the edge list count as a single edge, like the out links of page_rank_complete.py.
+page_rank_complete.py counts the nodes itself, this is for --n_nodes of page_rank.py and for a quick look at a graph.
+
+Usage:
+    python count_nodes.py data/soc-Epinions1.txt
 """
-input_file = "data/soc-Epinions1.txt"
+import argparse
+import mmap
+
+CHUNK_SIZE = 1 << 24
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """
+    Memory maps the file and yields chunks of whole lines
+
+    :param path: path of the file
+    :param chunk_size: approximate size of the chunks in bytes
+    :return: iterator of bytes
+    """
+    with open(path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while start < len(data):
+                end = data.find(b'\n', start + chunk_size)
+                end = len(data) if end == -1 else end + 1
+                yield data[start:end]
+                start = end
+
+
+def graph_stats(path):
+    """
+    :param path: path of a tab separated edge list (lines starting with "#" are ignored)
+    :return: dict of n_nodes, min_node_id, max_node_id, n_edges (unique (source, target) pairs) and n_dangling_nodes
+    """
+    sources = set()
+    nodes = set()
+    edges = set()
+    for chunk in read_chunks(path):
+        if b'#' in chunk:
+            chunk = b'\n'.join(line for line in chunk.split(b'\n') if not line.startswith(b'#'))
+        node_ids = chunk.split()
+        if len(node_ids) % 2:
+            raise ValueError('{} has a line without two node ids'.format(path))
+        chunk_sources = list(map(int, node_ids[0::2]))
+        chunk_targets = list(map(int, node_ids[1::2]))
+        sources.update(chunk_sources)
+        nodes.update(chunk_sources)
+        nodes.update(chunk_targets)
+        edges.update(zip(chunk_sources, chunk_targets))
+
+    return {'n_nodes': len(nodes),
+            'min_node_id': min(nodes) if nodes else None,
+            'max_node_id': max(nodes) if nodes else None,
+            'n_edges': len(edges),
+            'n_dangling_nodes': len(nodes) - len(sources)}
+
 
-nodes = []
-with open(input_file) as f:
-    for line in f.readlines():
-        line = line.split("\t")
-        nodes.append(int(line[0]))
-        nodes.append(int(line[1]))
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Statistics of an edge list')
+    parser.add_argument('path', nargs='?', default='data/soc-Epinions1.txt', help='edge list file')
+    options = parser.parse_args(args)
 
-nodes = set(nodes)
+    stats = graph_stats(options.path)
+    print("Min node id: {}, Max node id: {}, Num of unique nodes {}".format(
+        stats['min_node_id'], stats['max_node_id'], stats['n_nodes']))
+    print("Num of edges: {}, Num of dangling nodes: {}".format(stats['n_edges'], stats['n_dangling_nodes']))
 
-min_node_id = min(nodes)
-max_node_id = max(nodes)
-num_nodes = len(nodes)
 
-print("Min node id: {}, Max node id: {}, Num of unique nodes {}".format(min_node_id, max_node_id, num_nodes))
\ No newline at end of file
+if __name__ == '__main__':
+    main()
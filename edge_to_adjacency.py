@@ -1,59 +1,83 @@
+"""
+Builds the graph of an edge list once, page_rank_complete.py then runs on it with --graph.
+
+With --output-dir, the output is a graph directory (see graph_format.py):
+    python edge_to_adjacency.py data/soc-Epinions1.txt --node_protocol packed --output-dir graph
+    python page_rank_complete.py --graph graph --damping_factor 0.9
+"""
 from mrjob.job import MRJob, MRStep
 from mrjob.protocol import TextProtocol
+from mrjob.step import StepFailedException
 from collections import defaultdict
+from adjacency import AdjacencyMixin
+from graph_format import write_manifest
+from instrumentation import CountersMixin, GROUP
+from protocols import NODE_PROTOCOLS
+import codecs
+import logging
+import sys
+
+log = logging.getLogger(__name__)
 
 
-class MRPageRank(MRJob):
+class MRPageRank(AdjacencyMixin, CountersMixin, MRJob):
     INPUT_PROTOCOL = TextProtocol
+    FILES = ['protocols.py', 'adjacency.py', 'instrumentation.py', 'graph_format.py']
 
     def configure_args(self):
         super(MRPageRank, self).configure_args()
         self.add_passthru_arg(
-            '--n_nodes', type=int, default=75879, help='Number of nodes in the graph')
+            '--n_nodes', type=int, default=None,
+            help='Number of nodes in the graph, without it the page ranks are 0 (see graph_format.py)')
+        self.add_passthru_arg(
+            '--node_protocol', choices=sorted(NODE_PROTOCOLS), default='json',
+            help='Serialisation of the nodes: json, packed (int32 out links) or varint (delta coded out links)')
 
-    def convert_edge_list_to_adjacency_list_reducer1(self, node_id, nodes):
+    def internal_protocol(self):
         """
-        converts the edge list (node_a, node_b) into a node
-        with adjacency list ({out_links = [a,b,c], page_rank = pr})
-        :param node_id:
-        :param nodes:
+        The nodes are sorted by the same keys as in the shuffle of page_rank_complete.py (required by --schimmy)
+
         :return:
         """
-        node = dict()
-        node['out_links'] = list(nodes)
-        node['page_rank'] = 1 / self.options.n_nodes
-        yield node_id, node
-        for out_node_id in node['out_links']:
-            yield out_node_id, "*"
-
-    def convert_edge_list_to_adjacency_list_reducer2(self, node_id, nodes):
+        return NODE_PROTOCOLS[self.options.node_protocol]()
+
+    def output_protocol(self):
+        return NODE_PROTOCOLS[self.options.node_protocol]()
+
+    def steps(self):
+        steps = [MRStep(mapper=self.edge_list_mapper,
+                        reducer=self.convert_edge_list_to_adjacency_list_reducer)]
+        return steps
+
+    def run_job(self):
         """
-        converts the edge list (node_a, node_b) into a node
-        with adjacency list ({out_links = [a,b,c], page_rank = pr})
-        :param node_id:
-        :param nodes:
+        Same as MRJob.run_job, except that the output directory gets the manifest of the graph (see graph_format.py)
+
         :return:
         """
-        real_node = None
-        for node in nodes:
-            if node == "*":
-                pass
-            elif isinstance(node, dict):
-                real_node = node
-            else:
-                raise ValueError("Shouldn't happen")
-
-        if real_node is None:
-            real_node = dict()
-            real_node['out_links'] = []
-            real_node['page_rank'] = 1 / self.options.n_nodes
-
-        yield node_id, real_node
+        self.set_up_logging(quiet=self.options.quiet,
+                            verbose=self.options.verbose,
+                            stream=codecs.getwriter('utf_8')(self.stderr))
 
-    def steps(self):
-        steps = [MRStep(reducer=self.convert_edge_list_to_adjacency_list_reducer1)] + \
-                [MRStep(reducer=self.convert_edge_list_to_adjacency_list_reducer2)]
-        return steps
+        with self.make_runner() as runner:
+            try:
+                runner.run()
+            except StepFailedException as e:
+                log.error(str(e))
+                sys.exit(1)
+
+            if self.options.output_dir:
+                counters = runner.counters()[-1].get(GROUP, {}) if runner.counters() else {}
+                if 'nodes' not in counters:
+                    raise ValueError('The manifest of the graph is built from the counters (don\'t use --no-read-logs)')
+                write_manifest(runner, self.options.node_protocol,
+                               'zero' if self.options.n_nodes is None else 'uniform',
+                               counters['nodes'], counters.get('edges', 0), counters.get('dangling nodes', 0))
+            if self._should_cat_output():
+                for chunk in runner.cat_output():
+                    self.stdout.write(chunk)
+                self.stdout.flush()
+        self.log_counters_summary()
 
 
 if __name__ == '__main__':
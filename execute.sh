@@ -11,6 +11,19 @@ s3://mapreduce123443/data/shortjokes.csv \
 --cluster-id j-3S07C4STGBV7Z \
 --output-dir=s3://mapreduce123443/output/bigram_prob_stripes_22feb_1
 
+# bigram stripes, shuffling the ids of the words from a vocabulary
+cd /Volumes/SD/PyCharmProjects/cc_coursework;
+python /Volumes/SD/PyCharmProjects/cc_coursework/vocabulary.py \
+s3://mapreduce123443/data/shortjokes.csv \
+-r emr \
+--cluster-id j-3S07C4STGBV7Z > vocabulary.txt
+python /Volumes/SD/PyCharmProjects/cc_coursework/bigram_prob_stripes.py \
+s3://mapreduce123443/data/shortjokes.csv \
+-r emr \
+--cluster-id j-3S07C4STGBV7Z \
+--vocabulary vocabulary.txt \
+--output-dir=s3://mapreduce123443/output/bigram_prob_stripes_vocabulary
+
 # bigram pairs
 cd /Volumes/SD/PyCharmProjects/cc_coursework;
 python /Volumes/SD/PyCharmProjects/cc_coursework/bigram_prob_pairs.py \
@@ -33,13 +46,107 @@ s3://mapreduce123443/data/soc-Epinions1.txt \
 --output-dir=s3://mapreduce123443/output/epinions_pagerank_simple_final
 
 # page rank complete
+# (the driver reads the number of nodes and the dangling mass from the job counters, so the logs have to be read)
 cd /Volumes/SD/PyCharmProjects/cc_coursework;
 python /Volumes/SD/PyCharmProjects/cc_coursework/page_rank_complete.py \
 s3://mapreduce123443/data/soc-Epinions1.txt \
 -r emr \
 --cluster-id j-3S07C4STGBV7Z \
---n_iterations=50 --n_nodes=75879 \
---min_node_id=0 --max_node_id=75887 \
+--n_iterations=50 \
 --damping_factor=0.85 --top_n=80000 \
---no-read-logs \
 --output-dir=s3://mapreduce123443/output/epinions_pagerank_complete_final
+
+# page rank complete, without the separate job completing the page ranks after each iteration
+cd /Volumes/SD/PyCharmProjects/cc_coursework;
+python /Volumes/SD/PyCharmProjects/cc_coursework/page_rank_complete.py \
+s3://mapreduce123443/data/soc-Epinions1.txt \
+-r emr \
+--cluster-id j-3S07C4STGBV7Z \
+--fused \
+--n_iterations=50 \
+--damping_factor=0.85 --top_n=80000 \
+--output-dir=s3://mapreduce123443/output/epinions_pagerank_complete_fused
+
+# page rank complete, saving the graph with the page ranks and updating it later with a file of edge changes
+# ("<source>\t<target>" adds an edge, "-<source>\t<target>" removes it), starting from the saved page ranks
+cd /Volumes/SD/PyCharmProjects/cc_coursework;
+python /Volumes/SD/PyCharmProjects/cc_coursework/page_rank_complete.py \
+s3://mapreduce123443/data/soc-Epinions1.txt \
+-r emr \
+--cluster-id j-3S07C4STGBV7Z \
+--n_iterations=50 \
+--damping_factor=0.85 --top_n=80000 \
+--graph_output_dir=s3://mapreduce123443/output/epinions_graph \
+--output-dir=s3://mapreduce123443/output/epinions_pagerank_complete_final
+python /Volumes/SD/PyCharmProjects/cc_coursework/page_rank_complete.py \
+s3://mapreduce123443/data/soc-Epinions1-changes.txt \
+-r emr \
+--cluster-id j-3S07C4STGBV7Z \
+--previous_graph=s3://mapreduce123443/output/epinions_graph \
+--n_iterations=50 --tolerance=0.00001 \
+--damping_factor=0.85 --top_n=80000 \
+--graph_output_dir=s3://mapreduce123443/output/epinions_graph_updated \
+--output-dir=s3://mapreduce123443/output/epinions_pagerank_complete_updated
+
+# page rank complete on a graph built once by edge_to_adjacency.py (see graph_format.py),
+# e.g. to try other damping factors without building the graph again
+cd /Volumes/SD/PyCharmProjects/cc_coursework;
+python /Volumes/SD/PyCharmProjects/cc_coursework/edge_to_adjacency.py \
+s3://mapreduce123443/data/soc-Epinions1.txt \
+-r emr \
+--cluster-id j-3S07C4STGBV7Z \
+--node_protocol=packed \
+--output-dir=s3://mapreduce123443/output/epinions_graph_packed
+python /Volumes/SD/PyCharmProjects/cc_coursework/page_rank_complete.py \
+-r emr \
+--cluster-id j-3S07C4STGBV7Z \
+--graph=s3://mapreduce123443/output/epinions_graph_packed \
+--n_iterations=50 \
+--damping_factor=0.9 --top_n=80000 \
+--output-dir=s3://mapreduce123443/output/epinions_pagerank_complete_090
+
+# block page rank: every round iterates 5 times within blocks of 1000 consecutive node ids,
+# so far fewer rounds (shuffles) are needed than iterations
+cd /Volumes/SD/PyCharmProjects/cc_coursework;
+python /Volumes/SD/PyCharmProjects/cc_coursework/page_rank_complete.py \
+-r emr \
+--cluster-id j-3S07C4STGBV7Z \
+--graph=s3://mapreduce123443/output/epinions_graph_packed \
+--block_size=1000 --inner_iterations=5 \
+--n_iterations=20 --tolerance=0.00001 \
+--damping_factor=0.85 --top_n=80000 \
+--output-dir=s3://mapreduce123443/output/epinions_pagerank_blocks
+
+# personalized page rank of many seed sets (one per line of the seeds file) in a single pass per iteration
+cd /Volumes/SD/PyCharmProjects/cc_coursework;
+python /Volumes/SD/PyCharmProjects/cc_coursework/page_rank_complete.py \
+-r emr \
+--cluster-id j-3S07C4STGBV7Z \
+--graph=s3://mapreduce123443/output/epinions_graph_packed \
+--seeds=s3://mapreduce123443/data/epinions_seed_sets.txt \
+--n_iterations=30 --tolerance=0.00001 \
+--damping_factor=0.85 --top_n=100 \
+--output-dir=s3://mapreduce123443/output/epinions_personalized_pagerank
+
+# top nodes estimated from 100 random walks per node, in about 7 jobs instead of 50 iterations
+cd /Volumes/SD/PyCharmProjects/cc_coursework;
+python /Volumes/SD/PyCharmProjects/cc_coursework/page_rank_complete.py \
+-r emr \
+--cluster-id j-3S07C4STGBV7Z \
+--graph=s3://mapreduce123443/output/epinions_graph_packed \
+--random_walks=100 \
+--damping_factor=0.85 --top_n=100 \
+--output-dir=s3://mapreduce123443/output/epinions_pagerank_random_walks
+
+# adaptive page rank: the nodes whose page rank changes by less than 0.001% freeze and leave the shuffle,
+# e.g. after a small update of a saved graph most of the nodes freeze in the first iterations
+cd /Volumes/SD/PyCharmProjects/cc_coursework;
+python /Volumes/SD/PyCharmProjects/cc_coursework/page_rank_complete.py \
+s3://mapreduce123443/data/soc-Epinions1-changes.txt \
+-r emr \
+--cluster-id j-3S07C4STGBV7Z \
+--previous_graph=s3://mapreduce123443/output/epinions_graph \
+--freeze_tolerance=0.00001 \
+--n_iterations=50 --tolerance=0.00001 \
+--damping_factor=0.85 --top_n=80000 \
+--output-dir=s3://mapreduce123443/output/epinions_pagerank_adaptive
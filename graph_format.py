@@ -0,0 +1,115 @@
+"""
+The graph directories written by edge_to_adjacency.py and by page_rank_complete.py (--graph_output_dir),
+which page_rank_complete.py takes as input (--graph, --previous_graph) instead of building the graph again.
+
+A graph directory holds:
+- part-* - the nodes ({out_links = [a,b,c], page_rank = pr}) one per line, written with a node protocol
+    (see protocols.py, packed and varint store the nodes as compact binary records), so the parts can be split
+    by lines. Every part is written by a reducer (the adjacency or the save_graph phase of page_rank_complete.py),
+    so it's sorted by node id like the shuffle of the iterations and --schimmy can merge them.
+- _manifest.json - version of the format, the node protocol, statistics of the graph and the index of the parts
+    (Hadoop ignores files starting with "_")
+
+The page ranks of the nodes are either
+- "zero" - the graph was built without the number of nodes, the whole mass is passed to the first iteration
+    as dangling mass (see page_rank_complete.py)
+- "uniform" - 1 / n_nodes
+- "complete" - the page ranks of a finished run
+"""
+from mrjob.fs.hadoop import HadoopFilesystem
+from mrjob.fs.local import LocalFilesystem
+from mrjob.parse import is_s3_uri, is_uri
+import json
+import os
+import posixpath
+import tempfile
+
+MANIFEST = '_manifest.json'
+FORMAT = 'page_rank_graph'
+VERSION = 1
+PAGE_RANKS = ('zero', 'uniform', 'complete')
+
+
+def filesystem(path):
+    """
+    :param path: local path or URI
+    :return: mrjob filesystem which can read the path
+    """
+    if not is_uri(path):
+        return LocalFilesystem()
+    elif is_s3_uri(path):
+        # boto3 is only needed for graphs on S3
+        from mrjob.fs.s3 import S3Filesystem
+        return S3Filesystem()
+    return HadoopFilesystem()
+
+
+def write_manifest(runner, node_protocol, page_ranks, n_nodes, n_edges, n_dangling_nodes):
+    """
+    Writes the manifest into the output directory of the runner, which holds the nodes
+
+    :param runner: the runner of the job which wrote the nodes
+    :param node_protocol: --node_protocol of the job
+    :param page_ranks: one of PAGE_RANKS
+    :param n_nodes: number of nodes
+    :param n_edges: number of edges
+    :param n_dangling_nodes: number of nodes without out links
+    :return:
+    """
+    output_dir = runner.get_output_dir()
+    parts = [{'name': posixpath.basename(path), 'bytes': runner.fs.du(path)}
+             for path in sorted(runner.fs.ls(output_dir)) if posixpath.basename(path).startswith('part-')]
+    manifest = {'format': FORMAT,
+                'version': VERSION,
+                'node_protocol': node_protocol,
+                'page_ranks': page_ranks,
+                'n_nodes': n_nodes,
+                'n_edges': n_edges,
+                'n_dangling_nodes': n_dangling_nodes,
+                'parts': parts}
+
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    try:
+        runner.fs.put(f.name, posixpath.join(output_dir, MANIFEST))
+    finally:
+        os.remove(f.name)
+
+
+def read_manifest(graph_dir):
+    """
+    :param graph_dir: a graph directory
+    :return: the manifest as a dict
+    """
+    fs = filesystem(graph_dir)
+    path = posixpath.join(graph_dir, MANIFEST)
+    if not fs.exists(path):
+        raise ValueError('{} is not a graph directory, it has no {} '
+                         '(see edge_to_adjacency.py and --graph_output_dir)'.format(graph_dir, MANIFEST))
+    manifest = json.loads(b''.join(fs.cat(path)).decode('utf_8'))
+    if manifest.get('format') != FORMAT or manifest.get('version') != VERSION:
+        raise ValueError('{} has an unsupported format {} (version {}), expected {} (version {})'.format(
+            graph_dir, manifest.get('format'), manifest.get('version'), FORMAT, VERSION))
+    return manifest
+
+
+def absolute_path(path):
+    """
+    The tasks of the jobs don't run in the working directory of the driver,
+    so local graph directories are passed on to them as absolute paths
+
+    :param path: local path or URI
+    :return: the absolute path, or the URI
+    """
+    if is_uri(path):
+        return path
+    return os.path.abspath(path)
+
+
+def part_paths(graph_dir, manifest):
+    """
+    :param graph_dir: a graph directory
+    :param manifest: it's manifest
+    :return: paths of the parts holding the nodes
+    """
+    return [posixpath.join(graph_dir, part['name']) for part in manifest['parts']]
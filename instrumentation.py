@@ -0,0 +1,141 @@
+"""
+Counters and timers shared by the jobs (see CountersMixin).
+
+For every task of every step, the jobs report in the "instrumentation" counter group:
+- <task> records in / <task> records out - e.g. "mapper records in"
+- <task> ms - time spent in the task
+- <task> input ms - part of it spent reading and decoding (e.g. JSON) the input records
+- in-mapper combiner records in / out - records before and after the "in-mapper" combiners
+- any other count of the job (see CountersMixin.count)
+
+Once the job finished, the counters of every step are logged together with the slowest steps.
+"""
+from collections import Counter
+import logging
+import time
+
+# the jobs run as scripts, MRJob.set_up_logging sets up the __main__ logger
+log = logging.getLogger('__main__')
+
+GROUP = 'instrumentation'
+N_SLOWEST_STEPS = 5
+
+
+class CountersMixin(object):
+    """
+    Mixin for the MRJob's (class MRJob(CountersMixin, MRJob)), the counts are kept in memory
+    and written as Hadoop counters once at the end of every task, as every counter update is a line on stderr.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CountersMixin, self).__init__(*args, **kwargs)
+        self.task_counts = Counter()
+        self.runners = []
+
+    def count(self, counter, amount=1):
+        """
+        Adds to a counter of the current task
+
+        :param counter: counter name
+        :param amount: integer amount
+        :return:
+        """
+        self.task_counts[counter] += amount
+
+    def map_pairs(self, pairs, step_num=0):
+        return self.instrument_task('mapper', super(CountersMixin, self).map_pairs, pairs, step_num)
+
+    def combine_pairs(self, pairs, step_num=0):
+        return self.instrument_task('combiner', super(CountersMixin, self).combine_pairs, pairs, step_num)
+
+    def reduce_pairs(self, pairs, step_num=0):
+        return self.instrument_task('reducer', super(CountersMixin, self).reduce_pairs, pairs, step_num)
+
+    def instrument_task(self, task_type, run_task, pairs, step_num):
+        """
+        Runs the task, counting the records in and out and timing the task and the reading of it's input
+
+        :param task_type: mapper, combiner or reducer
+        :param run_task: MRJob.map_pairs, combine_pairs or reduce_pairs
+        :param pairs: decoded input pairs of the task
+        :param step_num: step number
+        :return: output pairs of the task
+        """
+        self.task_counts = Counter()
+        timings = {'input': 0.0, 'records': 0}
+        start = time.perf_counter()
+
+        def timed_pairs():
+            pairs_iterator = iter(pairs)
+            while True:
+                input_start = time.perf_counter()
+                pair = next(pairs_iterator, None)
+                timings['input'] += time.perf_counter() - input_start
+                if pair is None:
+                    return
+                timings['records'] += 1
+                yield pair
+
+        records_out = 0
+        for key, value in run_task(timed_pairs(), step_num=step_num):
+            records_out += 1
+            yield key, value
+
+        self.count(task_type + ' records in', timings['records'])
+        self.count(task_type + ' records out', records_out)
+        self.count(task_type + ' input ms', int(round(timings['input'] * 1000)))
+        self.count(task_type + ' ms', int(round((time.perf_counter() - start) * 1000)))
+        for counter, amount in sorted(self.task_counts.items()):
+            self.increment_counter(GROUP, counter, amount)
+
+    def make_runner(self):
+        runner = super(CountersMixin, self).make_runner()
+        self.add_runner(self.__class__.__name__, runner)
+        return runner
+
+    def add_runner(self, name, runner):
+        """
+        Adds the runner of a job (e.g. a phase of a driver) to the summary
+
+        :param name: name of the job in the summary
+        :param runner: the runner, it's counters are read by log_counters_summary
+        :return:
+        """
+        self.runners.append((name, runner))
+
+    def run_job(self):
+        super(CountersMixin, self).run_job()
+        self.log_counters_summary()
+
+    def log_counters_summary(self):
+        """
+        Logs the counters of every step of every runner, followed by the slowest steps
+
+        :return:
+        """
+        step_times = []
+        for name, runner in self.runners:
+            for step_num, step_counters in enumerate(runner.counters()):
+                counters = step_counters.get(GROUP)
+                if not counters:
+                    continue
+                step_name = '{} step {}'.format(name, step_num + 1)
+                log.info('{}: {}'.format(step_name, format_counters(counters)))
+                step_times.append((sum(amount for counter, amount in counters.items()
+                                       if counter.endswith(' ms') and not counter.endswith(' input ms')), step_name))
+        slowest_steps = sorted(step_times, reverse=True)[:N_SLOWEST_STEPS]
+        if slowest_steps:
+            log.info('Slowest steps: {}'.format(', '.join(
+                '{} ({} ms)'.format(step_name, ms) for ms, step_name in slowest_steps)))
+
+
+def format_counters(counters):
+    """
+    :param counters: {counter: amount} of a step
+    :return: the counters as text, with the ratio of the in-mapper combiner
+    """
+    text = ', '.join('{}={}'.format(counter, amount) for counter, amount in sorted(counters.items()))
+    records_in = counters.get('in-mapper combiner records in')
+    if records_in:
+        text += ', in-mapper combiner ratio={:.3f}'.format(counters.get('in-mapper combiner records out', 0) / records_in)
+    return text
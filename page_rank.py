@@ -1,18 +1,29 @@
 from mrjob.job import MRJob, MRStep
 from mrjob.protocol import TextProtocol
+from mrjob.step import StepFailedException
 from collections import defaultdict
-import heapq
+from adjacency import AdjacencyMixin
+from instrumentation import CountersMixin
+from protocols import NODE_PROTOCOLS
+from top_n import TopNMixin, cat_top_n
+import codecs
+import logging
+import sys
 
+log = logging.getLogger(__name__)
 
-class MRPageRank(MRJob):
+
+class MRPageRank(TopNMixin, AdjacencyMixin, CountersMixin, MRJob):
     INPUT_PROTOCOL = TextProtocol
+    FILES = ['protocols.py', 'adjacency.py', 'top_n.py', 'instrumentation.py']
 
     def configure_args(self):
         """
         We configure:
         - n_iterations - number of iterations of page rank
-        - n_nodes - number of nodes in the graph
+        - n_nodes - number of nodes in the graph (see count_nodes.py), required as there is no default that would fit
         - top_n - how many of the top results we want
+        - node_protocol - how the node structures are serialised between the steps (see protocols.py)
 
         :return:
         """
@@ -20,56 +31,35 @@ class MRPageRank(MRJob):
         self.add_passthru_arg(
             '--n_iterations', type=int, default=10, help='Number of iterations of page rank to run')
         self.add_passthru_arg(
-            '--n_nodes', type=int, default=75879, help='Number of nodes in the graph')
+            '--n_nodes', type=int, default=None, help='Number of nodes in the graph (computed using count_nodes.py)')
         self.add_passthru_arg(
             '--top_n', type=int, default=20, help='Number of top pages to output')
+        self.add_passthru_arg(
+            '--node_protocol', choices=sorted(NODE_PROTOCOLS), default='json',
+            help='Serialisation of the nodes: json, packed (int32 out links) or varint (delta coded out links)')
 
-    def convert_edge_list_to_adjacency_list_reducer(self, node_id, nodes):
-        """
-        Converts the edge list (node_a, node_b) into a single node
-        with adjacency list ({out_links = [a,b,c], page_rank = pr})
-
-        Furthermore, we output all outgoing nodes with a placeholder "*"
-        to initialise the dangling nodes in the following reducer
-
-        :param node_id: the node id which is the key in reduce step
-        :param nodes: list of node id's
-        :return:
-        """
-        node = dict()
-        node['out_links'] = list(nodes)
-        node['page_rank'] = 1 / self.options.n_nodes  # default values
-        yield node_id, node
-
-        for out_node_id in node['out_links']:
-            yield out_node_id, "*"
-
-    def convert_edge_list_to_adjacency_list_reducer_dangling(self, node_id, nodes):
+    def pick_protocols(self, step_num, step_type):
         """
-        The previous reducer outputs a node id and either "*" or the nodes structure as value.
+        The nodes are serialised with --node_protocol from the output of the adjacency step
+        up to the input of the top N step, including the shuffle of every iteration.
 
-        This reducer doesn't change the nodes that have a node structure as value.
-        For nodes that only have "*" as value, it constructs a dangling node.
-
-        :param node_id: the node id which is the key in reduce step
-        :param nodes: list "*" or node structure
-        :return:
+        :param step_num: which step to run
+        :param step_type: 'mapper' or 'reducer'
+        :return: (read_function, write_function)
         """
-        real_node = None
-        for node in nodes:
-            if node == "*":
-                pass
-            elif isinstance(node, dict):
-                real_node = node
-            else:
-                raise ValueError("Shouldn't happen")
+        read, write = super(MRPageRank, self).pick_protocols(step_num, step_type)
+        node_protocol = NODE_PROTOCOLS[self.options.node_protocol]()
+        top_n_step_num = len(self.steps()) - 1
 
-        if real_node is None:
-            real_node = dict()
-            real_node['out_links'] = []
-            real_node['page_rank'] = 1 / self.options.n_nodes
-
-        yield node_id, real_node
+        # the adjacency step (0) outputs the nodes, the top N step reads them
+        if 1 <= step_num <= top_n_step_num and step_type == 'mapper':
+            read = node_protocol.read
+        if 1 <= step_num < top_n_step_num:
+            # mappers and reducers of the iterations
+            read, write = node_protocol.read, node_protocol.write
+        if step_num == 0 and step_type == 'reducer':
+            write = node_protocol.write
+        return read, write
 
     def map_page_rank_contribution_init(self):
         """
@@ -97,6 +87,7 @@ class MRPageRank(MRJob):
             page_rank_contribution = node['page_rank'] / len(node['out_links'])
             for out_link_node_id in node['out_links']:
                 self.incoming_page_ranks[out_link_node_id] += page_rank_contribution
+            self.count('in-mapper combiner records in', len(node['out_links']))
         yield node_id, node
 
     def map_page_rank_contribution_final(self):
@@ -105,6 +96,7 @@ class MRPageRank(MRJob):
 
         :return:
         """
+        self.count('in-mapper combiner records out', len(self.incoming_page_ranks))
         for node_id in self.incoming_page_ranks.keys():
             yield node_id, self.incoming_page_ranks[node_id]
 
@@ -132,86 +124,44 @@ class MRPageRank(MRJob):
         node['page_rank'] = page_rank_sum
         yield node_id, node
 
-    def topN_mapper_init(self):
-        """
-        Stores all the page ranks received in the mapper
-
-        :return:
-        """
-        self.values = []
-
-    def topN_mapper(self, node_id, node):
-        """
-        Reverts the order so that page ranks are keys.
-        This is used together with a custom comparator in the shuffle stage before the next reducer
-
-        :param node_id:
-        :param node:
-        :return:
-        """
-        self.values.append((node['page_rank'], node_id))
-
-    def topN_mapper_final(self):
-        """
-        Returns N largest values based on page rank as (page rank, node id)
-
-        :return:
-        """
-        for pair in heapq.nlargest(n=self.options.top_n, iterable=self.values, key=lambda x: x[0]):
-            yield pair
-
-    def topN_reducer_init(self):
-        """
-        Keeps track of how many top page ranks were iterated over
-
-        :return:
-        """
-        self.values = []
-
-    def topN_reducer(self, page_rank, node_ids):
-        """
-        Outputs the top N nodes along with their page ranks
-
-        :param page_rank:
-        :param node_ids:
-        :return:
-        """
-        for node_id in node_ids:
-            self.values.append((page_rank, node_id))
-
-    def topN_reducer_final(self):
-        """
-        Returns N largest values based on page rank as (page rank, node id)
-
-        :return:
-        """
-        for pair in heapq.nlargest(n=self.options.top_n, iterable=self.values, key=lambda x: x[0]):
-            yield pair
-
     def steps(self):
-        steps = [MRStep(reducer=self.convert_edge_list_to_adjacency_list_reducer)] + \
-                [MRStep(reducer=self.convert_edge_list_to_adjacency_list_reducer_dangling)] + \
+        if self.options.n_nodes is None:
+            raise ValueError('--n_nodes is required, count the nodes with count_nodes.py '
+                             '(page_rank_complete.py counts them itself)')
+        steps = [MRStep(mapper=self.edge_list_mapper,
+                        reducer=self.convert_edge_list_to_adjacency_list_reducer)] + \
                 [MRStep(
                     mapper_init=self.map_page_rank_contribution_init,
                     mapper=self.map_page_rank_contribution,
                     mapper_final=self.map_page_rank_contribution_final,
                     reducer=self.reduce_incoming_page_rank_contributions)
                 ] * self.options.n_iterations + \
-                [MRStep(mapper_init=self.topN_mapper_init,
-                        mapper=self.topN_mapper,
-                        mapper_final=self.topN_mapper_final,
-                        reducer_init=self.topN_reducer_init,
-                        reducer=self.topN_reducer,
-                        reducer_final=self.topN_reducer_final,
-                        jobconf={
-                            'mapred.reduce.tasks': 1,
-                            'mapred.output.key.comparator.class': 'org.apache.hadoop.mapred.lib.KeyFieldBasedComparator',
-                            'mapred.text.key.comparator.options': '-k1,1nr'
-                        })
-                 ]
+                self.top_n_steps()
 
         return steps
 
+    def run_job(self):
+        """
+        Same as MRJob.run_job, except that the sorted parts of the top N output are merged (see top_n.py),
+        followed by the summary of the counters (see instrumentation.py)
+
+        :return:
+        """
+        self.set_up_logging(quiet=self.options.quiet,
+                            verbose=self.options.verbose,
+                            stream=codecs.getwriter('utf_8')(self.stderr))
+
+        with self.make_runner() as runner:
+            try:
+                runner.run()
+            except StepFailedException as e:
+                log.error(str(e))
+                sys.exit(1)
+
+            if self._should_cat_output():
+                cat_top_n(runner, self.options.top_n, self.stdout)
+        self.log_counters_summary()
+
 
 if __name__ == '__main__':
     MRPageRank.run()
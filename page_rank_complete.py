@@ -1,21 +1,89 @@
+from mrjob.compat import jobconf_from_env
+from mrjob.fs.hadoop import HadoopFilesystem
+from mrjob.fs.local import LocalFilesystem
 from mrjob.job import MRJob, MRStep
-from mrjob.protocol import TextProtocol
+from mrjob.parse import is_uri
+from mrjob.protocol import BytesValueProtocol, JSONProtocol, TextProtocol
+from mrjob.step import StepFailedException
+from mrjob.util import to_lines
 from collections import defaultdict
+from adjacency import AdjacencyMixin
+from graph_format import absolute_path, part_paths, read_manifest, write_manifest
+from instrumentation import CountersMixin, GROUP
+from protocols import NODE_PROTOCOLS
+from top_n import TopNMixin, cat_top_n, push_bounded
+import codecs
 import heapq
+import io
+import logging
+import math
+import posixpath
+import random
+import re
+import struct
+import sys
+import zlib
 
+log = logging.getLogger(__name__)
 
-class MRPageRank(MRJob):
+# hadoop counters are integers, so the dangling mass and the page rank deltas are passed through them as scaled integers
+COUNTER_SCALE = 10 ** 15
+
+# doubling the walk segments stops here at the latest (segments of up to 2 ** MAX_WALK_LEVELS steps)
+MAX_WALK_LEVELS = 20
+# the walks are split into independent groups (which only reuse the segments of their group),
+# the spread of the estimates of the groups measures the error of the page ranks (see walk_visits_reducer)
+WALK_GROUPS = 4
+
+# a line of the --previous_graph edge changes: "<source>\t<target>" adds an edge, "-<source>\t<target>" removes it
+EDGE_CHANGE = re.compile(br'^(-?)(\d+)\t(\d+)$')
+
+# the phases run by the driver (see run_driver) and the protocols of their (input, shuffle, output):
+# NODES is the --node_protocol (see protocols.py), LINES the raw lines and None the default protocol of the job
+NODES = 'nodes'
+LINES = 'lines'
+PHASES = {
+    'adjacency': (None, NODES, NODES),
+    'update': (LINES, NODES, NODES),
+    'iteration': (NODES, NODES, NODES),
+    'complete': (NODES, None, NODES),
+    'save_graph': (NODES, NODES, NODES),
+    'block': (NODES, None, NODES),
+    'personalized': (NODES, NODES, NODES),
+    'personalized_top_n': (NODES, None, None),
+    'walk_start': (NODES, None, NODES),
+    'walk': (NODES, NODES, NODES),
+    'walk_visits': (NODES, NODES, NODES),
+    'adaptive': (NODES, NODES, NODES),
+    'thaw': (NODES, NODES, NODES),
+    'top_n': (NODES, None, None),
+}
+
+
+class MRPageRank(TopNMixin, AdjacencyMixin, CountersMixin, MRJob):
     INPUT_PROTOCOL = TextProtocol
+    FILES = ['protocols.py', 'adjacency.py', 'top_n.py', 'instrumentation.py', 'graph_format.py']
 
     def configure_args(self):
         """
         We configure:
         - n_iterations - number of iterations of page rank
         - damping_factor - the damping factor from the page rank equation
-        - n_nodes - number of nodes in the graph
-        - min_node_id - the minimal node id
-        - max_node_id - the maximal node id
+        - n_nodes - number of nodes in the graph, counted by the driver if it's not given (see run_driver)
         - top_n - how many of the top results we want
+        - fused - run a single MapReduce step per iteration (see run_driver)
+        - node_protocol - how the node structures are serialised between the jobs (see protocols.py)
+        - schimmy - don't shuffle the graph structure in the iterations (see reduce_page_rank_contributions_schimmy)
+        - tolerance - stop iterating once the L1 change of the page ranks is smaller than this (n_iterations is then the maximum)
+        - graph - run on a graph saved by edge_to_adjacency.py or graph_output_dir instead of building it (see graph_format.py)
+        - graph_output_dir - save the graph with the final page ranks, which a later run can use or update
+        - previous_graph - update a graph saved with graph_output_dir with the edge changes in the input (see run_driver)
+        - block_size, block_partitioner, inner_iterations - iterate within blocks of the graph (see reduce_block)
+        - seeds - personalized page rank for every seed set of this file (see personalized_mapper)
+        - random_walks, walk_seed - estimate the page ranks from random walks (see start_walks_mapper)
+        - freeze_tolerance - stop updating the nodes whose page rank converged (see map_adaptive)
+        - phase, dangling_mass, graph_dir, walk_level, total_visits - used internally by run_driver
+            to launch the individual jobs
 
         :return:
         """
@@ -26,59 +94,227 @@ class MRPageRank(MRJob):
         self.add_passthru_arg(
             '--damping_factor', type=float, default=0.85, help='The damping factor using in the calculations')
         self.add_passthru_arg(
-            '--n_nodes', type=int, default=75879, help='Number of nodes in the graph (computed using count_nodes.py)')
+            '--n_nodes', type=int, default=None, help='Number of nodes in the graph (counted while building the graph by default)')
+        self.add_passthru_arg(
+            '--top_n', type=int, default=10, help='Number of top pages to output')
         self.add_passthru_arg(
-            '--min_node_id', type=int, default=0, help='Minimal node id (computed using count_nodes.py)')
+            '--fused', action='store_true', default=False,
+            help='Complete the page ranks in the next iteration instead of in a separate map only job')
         self.add_passthru_arg(
-            '--max_node_id', type=int, default=75887, help='Maximal node id (computed using count_nodes.py)')
+            '--schimmy', action='store_true', default=False,
+            help='Only shuffle the page rank contributions, the reducers merge them with the stored graph structure')
         self.add_passthru_arg(
-            '--top_n', type=int, default=10, help='Number of top pages to output')
+            '--tolerance', type=float, default=None,
+            help='Stop once the sum of absolute page rank changes of an iteration is below this value')
+        self.add_passthru_arg(
+            '--node_protocol', choices=sorted(NODE_PROTOCOLS), default='json',
+            help='Serialisation of the nodes: json, packed (int32 out links) or varint (delta coded out links)')
+        self.add_passthru_arg(
+            '--graph', default=None,
+            help='Graph directory written by edge_to_adjacency.py or --graph_output_dir, '
+                 'the iterations start from it instead of building the graph from the input')
+        self.add_passthru_arg(
+            '--graph_output_dir', default=None,
+            help='Save the graph with the final page ranks here, a later run can update it with --previous_graph')
+        self.add_passthru_arg(
+            '--previous_graph', default=None,
+            help='Graph saved with --graph_output_dir (with the same --node_protocol), the input is then a list '
+                 'of edge changes: "<source>\\t<target>" adds an edge, "-<source>\\t<target>" removes it')
+        self.add_passthru_arg(
+            '--block_size', type=int, default=None,
+            help='Partition the graph into blocks of this many nodes, every round (counted by --n_iterations) '
+                 'then runs --inner_iterations over the edges within the blocks')
+        self.add_passthru_arg(
+            '--block_partitioner', choices=['range', 'hash'], default='range',
+            help='Blocks of consecutive node ids (keeps the locality of crawled graphs) or of hashed node ids')
+        self.add_passthru_arg(
+            '--inner_iterations', type=int, default=5,
+            help='Number of iterations within the blocks in every round of --block_size. Only the graphs with '
+                 'most of the edges within the blocks gain from it, otherwise the rounds can converge slower '
+                 'than plain iterations (--inner_iterations 1 is the same as a plain iteration)')
+        self.add_file_arg(
+            '--seeds', default=None,
+            help='File with a seed set per line (node ids separated by whitespace), computes a personalized page rank '
+                 'for every seed set and outputs the top N nodes of each')
+        self.add_passthru_arg(
+            '--random_walks', type=int, default=None,
+            help='Estimate the page ranks from this many random walks per node instead of iterating '
+                 '(--n_iterations and --tolerance are then ignored)')
+        self.add_passthru_arg(
+            '--walk_seed', type=int, default=0, help='Random seed of the random walks')
+        self.add_passthru_arg(
+            '--freeze_tolerance', type=float, default=None,
+            help='Freeze the nodes once the relative change of their page rank in an iteration is below this value, '
+                 'the iterations then only shuffle the nodes which are still active')
+        self.add_passthru_arg(
+            '--phase', choices=sorted(PHASES), default=None,
+            help='Part of the computation to run, set by the driver')
+        self.add_passthru_arg(
+            '--dangling_mass', type=float, default=None,
+            help='Dangling mass of the previous iteration, set by the driver')
+        self.add_passthru_arg(
+            '--page_rank_mass', type=float, default=1.0,
+            help='Total page rank of the previous block round, set by the driver')
+        self.add_passthru_arg(
+            '--graph_dir', default=None,
+            help='Output of the adjacency phase which the --schimmy reducers merge with, set by the driver')
+        self.add_passthru_arg(
+            '--walk_level', type=int, default=None,
+            help='Level of the doubling of the walk segments, set by the driver')
+        self.add_passthru_arg(
+            '--total_visits', type=int, default=None,
+            help='Number of visits of all of the random walks, set by the driver')
 
-    def convert_edge_list_to_adjacency_list_reducer(self, node_id, nodes):
+    def phase_protocol(self, index, default):
         """
-        Converts the edge list (node_a, node_b) into a single node
-        with adjacency list ({out_links = [a,b,c], page_rank = pr})
+        :param index: 0 for the input, 1 for the shuffle and 2 for the output of the --phase (see PHASES)
+        :param default: default protocol of the job
+        :return: the protocol
+        """
+        protocol = PHASES[self.options.phase][index] if self.options.phase is not None else None
+        if protocol == NODES:
+            return NODE_PROTOCOLS[self.options.node_protocol]()
+        elif protocol == LINES:
+            return BytesValueProtocol()
+        return default
 
-        Furthermore, we output all outgoing nodes with a placeholder "*"
-        to initialise the dangling nodes in the following reducer
+    def input_protocol(self):
+        """
+        Only the adjacency phase reads the raw edge list, the other phases of the driver
+        read the nodes written by the previous job. The update phase reads both the nodes and the edge changes,
+        so it gets the raw lines (see update_graph_mapper).
 
-        :param node_id: the node id which is the key in reduce step
-        :param nodes: list of node id's
         :return:
         """
-        node = dict()
-        node['out_links'] = list(nodes)
-        node['page_rank'] = 1/self.options.n_nodes
-        yield node_id, node
-        for out_node_id in node['out_links']:
-            yield out_node_id, "*"
+        return self.phase_protocol(0, super(MRPageRank, self).input_protocol())
 
-    def convert_edge_list_to_adjacency_list_reducer_dangling(self, node_id, nodes):
+    def internal_protocol(self):
         """
-        The previous reducer outputs a node id and either "*" or the nodes structure as value.
+        The shuffle of an iteration carries the nodes and their page rank contributions.
 
-        This reducer doesn't change the nodes that have a node structure as value.
-        For nodes that only have "*" as value, it constructs a dangling node.
+        The adjacency and the update phases use the same protocol so that their output is partitioned and sorted
+        by the same keys as the shuffle of the iterations (required by --schimmy).
+        The shuffle of the block phase is keyed by blocks, it's values are lists (see map_block).
 
-        :param node_id: the node id which is the key in reduce step
-        :param nodes: list "*" or node structure
         :return:
         """
-        real_node = None
-        for node in nodes:
-            if node == "*":
-                pass
-            elif isinstance(node, dict):
-                real_node = node
+        return self.phase_protocol(1, super(MRPageRank, self).internal_protocol())
+
+    def output_protocol(self):
+        """
+        Every phase except the top N outputs nodes
+
+        :return:
+        """
+        return self.phase_protocol(2, super(MRPageRank, self).output_protocol())
+
+    def corrected_page_rank(self, page_rank):
+        """
+        The reducer can only store the sum of incoming contributions, as the dangling mass
+        of the iteration is known only after all of the mappers finished.
+        The driver passes that mass to the next job (--dangling_mass), which applies
+        the damping factor and the dangling mass here.
+
+        :param page_rank: page rank as stored in the node structure
+        :return: the complete page rank
+        """
+        if self.options.dangling_mass is None:
+            return page_rank
+        return ((1 - self.options.damping_factor) / self.options.n_nodes) \
+            + (self.options.damping_factor * (self.options.dangling_mass / self.options.n_nodes + page_rank))
+
+    def update_graph_mapper_init(self):
+        """
+        Initialises the protocol of the nodes of the --previous_graph
+
+        :return:
+        """
+        self.node_protocol = NODE_PROTOCOLS[self.options.node_protocol]()
+
+    def update_graph_mapper(self, _, line):
+        """
+        Reads either a node of the --previous_graph or an edge change (see EDGE_CHANGE), the node structures
+        never have a plain integer as value so the two can't be mistaken. Comment lines (starting with "#")
+        are skipped, any other line is an error.
+
+        For an added edge, the target gets a placeholder "*" so that new nodes are created,
+        like in convert_edge_list_to_adjacency_list_reducer.
+
+        :param _: None
+        :param line: raw line
+        :return: tuples of (node_id, node), (source, ["+" or "-", target]) or (target, "*")
+        """
+        if line.startswith(b'#'):
+            return
+        edge_change = EDGE_CHANGE.match(line.rstrip())
+        if edge_change is None:
+            try:
+                node_id, node = self.node_protocol.read(line)
+            except (ValueError, struct.error):
+                node = None
+            if not isinstance(node, dict):
+                raise ValueError('Line {!r} is neither an edge change ("[-]<source>\\t<target>") nor a node of the '
+                                 '--previous_graph (--node_protocol {})'.format(line, self.options.node_protocol))
+            yield node_id, node
+            return
+        removed, source, target = [group.decode('utf_8') for group in edge_change.groups()]
+        if removed:
+            yield source, ['-', target]
+        else:
+            yield source, ['+', target]
+            yield target, "*"
+
+    def update_graph_reducer(self, node_id, values):
+        """
+        Applies the edge changes to the out links of the node. The page rank of the previous run is kept
+        as the starting point of the iterations, new nodes start from 0 so that the page ranks still add up to 1
+        (otherwise the extra mass would only decay by the damping factor in every iteration).
+
+        Like in convert_edge_list_to_adjacency_list_reducer, every out link is kept once. A node which isn't
+        in the previous graph is only created by an added edge (or it's "*" placeholder), removals of edges
+        which don't exist are counted and otherwise ignored.
+
+        :param node_id: node id
+        :param values: the node structure (unless it's a new node), edge changes and "*" placeholders
+        :return:
+        """
+        node = None
+        added = False
+        added_out_links = []
+        removed_out_links = set()
+        for value in values:
+            if isinstance(value, dict):
+                node = value
+            elif value == "*":
+                added = True
+            elif value[0] == '+':
+                added = True
+                added_out_links.append(value[1])
             else:
-                raise ValueError("Shouldn't happen")
+                removed_out_links.add(value[1])
 
-        if real_node is None:
-            real_node = dict()
-            real_node['out_links'] = []
-            real_node['page_rank'] = 1/self.options.n_nodes
+        if node is None and not added:
+            self.count('missing removed edges', len(removed_out_links))
+            return
+        if node is None:
+            node = {'out_links': [], 'page_rank': 0.0}
+        # the out links are strings or integers, depending on --node_protocol, so they are compared as strings
+        out_links = dict((str(out_link), out_link) for out_link in node['out_links'])
+        self.count('missing removed edges', len(removed_out_links - set(out_links)))
+        for out_link in removed_out_links:
+            out_links.pop(out_link, None)
+        for out_link in added_out_links:
+            if out_link in out_links:
+                self.count('duplicate edges')
+            else:
+                out_links[out_link] = out_link
+        node['out_links'] = list(out_links.values())
 
-        yield node_id, real_node
+        self.count('nodes')
+        self.count('edges', len(node['out_links']))
+        if not node['out_links']:
+            self.count('dangling nodes')
+        yield node_id, node
 
     def map_page_rank_contribution_init(self):
         """
@@ -90,184 +326,1513 @@ class MRPageRank(MRJob):
         """
         self.incoming_page_ranks = defaultdict(lambda: 0)
         self.dangling_pr_mass = 0
+        self.page_rank_delta = 0
 
     def map_page_rank_contribution(self, node_id, node):
         """
         For every node id and it's associated node structure:
-        1.
+        1. completes the page rank if the previous job left it incomplete (see corrected_page_rank)
+        2.
         A) if it's not  dangling node:
             1. divides the page rank of the node by the total number of outgoing links
             2. stores the page rank contribution to every outgoing link (node)
                 which later gets emited using the "in-mapper" combiner patter
         B) if it's a dangling node
             1. store it's mass together with the mass of other dangling nodes
-        2. emits the inputs node_id and node_structure
+        3. emits the inputs node_id and node_structure (with the completed page rank),
+            with --schimmy only the completed page rank is emitted (in a list to tell it apart from contributions)
+
+        With --tolerance, also adds up the change from the previous page rank (see track_page_rank_delta).
 
         :param node_id: node id
         :param node: node structure in JSON format
         :return:
         """
+        node['page_rank'] = self.corrected_page_rank(node['page_rank'])
+        self.track_page_rank_delta(node)
         if len(node['out_links']) > 0:
             page_rank_contribution = node['page_rank'] / len(node['out_links'])
             for out_link_node_id in node['out_links']:
                 self.incoming_page_ranks[out_link_node_id] += page_rank_contribution
-        elif len(node['out_links']) == 0:
+            self.count('in-mapper combiner records in', len(node['out_links']))
+        else:
             self.dangling_pr_mass += node['page_rank']
-        yield node_id, node
+            self.count('dangling nodes')
+        if self.options.schimmy:
+            yield node_id, [node['page_rank']]
+        else:
+            yield node_id, node
+
+    def track_page_rank_delta(self, node):
+        """
+        With --tolerance, the reducer keeps the page rank the node had before the iteration
+        in "previous_page_rank". Once the page rank is complete, the absolute change is added to
+        self.page_rank_delta (reported in a counter) and the previous page rank is dropped.
+
+        :param node: node structure with a complete page rank
+        :return:
+        """
+        if 'previous_page_rank' in node:
+            self.page_rank_delta += abs(node['page_rank'] - node.pop('previous_page_rank'))
 
     def map_page_rank_contribution_final(self):
         """
         For every stored node_id, returns combined incoming page rank contributions.
 
-        Returns the page rank mass of all dangling nodes in this reducer using a special "d" key
+        The dangling mass isn't shuffled (it would have to be sent to every node), instead
+        it's reported through a counter which the driver reads once the job has finished.
         :return:
         """
+        self.count('in-mapper combiner records out', len(self.incoming_page_ranks))
         for node_id in self.incoming_page_ranks.keys():
             yield node_id, self.incoming_page_ranks[node_id]
-        yield 'd', self.dangling_pr_mass
+        self.increment_counter('page_rank', 'dangling_mass', int(round(self.dangling_pr_mass * COUNTER_SCALE)))
+        self.increment_counter('page_rank', 'page_rank_delta', int(round(self.page_rank_delta * COUNTER_SCALE)))
 
     def reduce_incoming_page_rank_contributions(self, node_id, page_rank_contributions):
         """
-        1)
-            A) If the incoming node is the sum of dangling masses,
-                then it loops through the range on all node id's and emits a page rank contribution to each node
-            B) If the node is a normal node, it just sums up the contributions, updates the nodes pages rank
-                and outputs the node structure
+        Sums up the contributions, updates the nodes page rank with the sum and outputs the node structure.
+
+        The damping factor and the dangling mass are applied later by complete_page_rank_mapper
+        or by the mapper of the next iteration (see corrected_page_rank).
 
         :param node_id: node id
-        :param page_rank_contributions: list of contributions -> either ("d",<mass>), (<node id>, <mass>), (<node id>, <node structure>)
+        :param page_rank_contributions: list of contributions -> either (<node id>, <mass>), (<node id>, <node structure>)
         :return:
         """
-        if node_id == 'd':
-            dangling_mass = sum(page_rank_contributions)
-            for node_id in range(self.options.min_node_id, self.options.max_node_id):
-                yield str(node_id), dangling_mass
+        node = None
+        page_rank_sum = 0
+        for page_rank_contribution in page_rank_contributions:
+            if isinstance(page_rank_contribution, float):
+                page_rank_sum += page_rank_contribution
+            else:
+                # this is the case where we send the actual node JSON structure
+                node = page_rank_contribution
+        if self.options.tolerance is not None:
+            node['previous_page_rank'] = node['page_rank']
+        node['page_rank'] = page_rank_sum
+        yield node_id, node
+
+    def reduce_page_rank_contributions_schimmy_init(self):
+        """
+        Opens the graph structure written by the adjacency phase (--graph_dir) as a stream of
+        (key as in the shuffle, line) sorted in the same order as the reducer input.
+
+        The adjacency phase and the iteration use the same partitioner and (by default) the same number of reducers,
+        so on Hadoop every reducer only reads its own part of the graph (the one with the same partition number).
+        Otherwise (e.g. with the local runners, which don't partition by key) all parts are merged.
+
+        :return:
+        """
+        fs = HadoopFilesystem() if is_uri(self.options.graph_dir) else LocalFilesystem()
+        paths = sorted(path for path in fs.ls(self.options.graph_dir)
+                       if posixpath.basename(path).startswith('part-'))
+        n_reducers = jobconf_from_env('mapreduce.job.reduces')
+        self.schimmy_partitioned = n_reducers is not None and int(n_reducers) == len(paths)
+        if self.schimmy_partitioned:
+            paths = [paths[int(jobconf_from_env('mapreduce.task.partition'))]]
+
+        def read_graph_part(path):
+            for line in to_lines(fs.cat(path)):
+                line = line.rstrip(b'\r\n')
+                yield line.split(b'\t', 1)[0], line
+
+        self.node_protocol = NODE_PROTOCOLS[self.options.node_protocol]()
+        self.graph = heapq.merge(*[read_graph_part(path) for path in paths], key=lambda record: record[0])
+
+    def next_graph_node(self, node_id):
+        """
+        Merge join: advances the graph stream up to the node structure of node_id
+
+        :param node_id: node id, in increasing order of the shuffle
+        :return: node structure
+        """
+        key = self.node_protocol.write(node_id, None).split(b'\t', 1)[0]
+        for graph_key, line in self.graph:
+            if graph_key == key:
+                return self.node_protocol.read(line)[1]
+            elif graph_key > key:
+                break
+            elif self.schimmy_partitioned:
+                break
+        if self.schimmy_partitioned:
+            raise ValueError('Node {} is not in the graph part of this reducer, the graph has to be partitioned '
+                             'like the shuffle (the local runners don\'t partition by key, '
+                             'so mapreduce.job.reduces shouldn\'t be set with them)'.format(node_id))
+        raise ValueError('Node {} is missing from the graph in {}'.format(node_id, self.options.graph_dir))
+
+    def reduce_page_rank_contributions_schimmy(self, node_id, page_rank_contributions):
+        """
+        Same as reduce_incoming_page_rank_contributions, except that the node structure isn't shuffled.
+        Instead it's read from the graph stored by the adjacency phase (the "schimmy" pattern),
+        which is sorted in the same order as the keys of the reducer.
+
+        Every node sends its own page rank to itself, so every node of the graph gets to the reducer.
+
+        :param node_id: node id
+        :param page_rank_contributions: list of contributions -> either (<node id>, <mass>), (<node id>, [<page rank>])
+        :return:
+        """
+        node = self.next_graph_node(node_id)
+        page_rank_sum = 0
+        for page_rank_contribution in page_rank_contributions:
+            if isinstance(page_rank_contribution, float):
+                page_rank_sum += page_rank_contribution
+            else:
+                # the page rank the node had before this iteration
+                node['page_rank'] = page_rank_contribution[0]
+        if self.options.tolerance is not None:
+            node['previous_page_rank'] = node['page_rank']
+        node['page_rank'] = page_rank_sum
+        yield node_id, node
+
+    def map_adaptive_init(self):
+        """
+        Same as map_page_rank_contribution_init, with a second "in-mapper" combiner for the contributions
+        of the nodes which freeze in this iteration:
+            - {node_id: [sum of the contributions of the frozen nodes] , ...}
+
+        :return:
+        """
+        self.map_page_rank_contribution_init()
+        self.frozen_page_ranks = defaultdict(lambda: 0)
+        self.frozen_dangling_pr_mass = 0
+
+    def map_adaptive(self, node_id, node):
+        """
+        Same as map_page_rank_contribution (as with --fused, the page rank is completed here), except that a node
+        freezes once the relative change of it's page rank is below --freeze_tolerance:
+        1. it's last contributions are sent as "frozen", the targets keep adding them up in every iteration
+            from then on (see reduce_adaptive), so the frozen node doesn't have to send them again
+        2. the node is replaced by a compact [<page rank>] record without the out links, which is passed
+            through the iterations unchanged (the out links are joined back by thaw_reducer)
+
+        :param node_id: node id
+        :param node: node structure, or [<page rank>] of a frozen node
+        :return:
+        """
+        if isinstance(node, list):
+            yield node_id, node
+            return
+
+        node['page_rank'] = self.corrected_page_rank(node['page_rank'])
+        previous_page_rank = node.get('previous_page_rank')
+        self.track_page_rank_delta(node)
+        frozen = previous_page_rank is not None \
+            and abs(node['page_rank'] - previous_page_rank) <= self.options.freeze_tolerance * node['page_rank']
+
+        incoming_page_ranks = self.frozen_page_ranks if frozen else self.incoming_page_ranks
+        if len(node['out_links']) > 0:
+            page_rank_contribution = node['page_rank'] / len(node['out_links'])
+            for out_link_node_id in node['out_links']:
+                incoming_page_ranks[out_link_node_id] += page_rank_contribution
+            self.count('in-mapper combiner records in', len(node['out_links']))
         else:
-            node = None
-            page_rank_sum = 0
-            for page_rank_contribution in page_rank_contributions:
-                if isinstance(page_rank_contribution, float):
-                    page_rank_sum += page_rank_contribution
-                else:
-                    # this is the case where we send the actual node JSON structure
-                    node = page_rank_contribution
-            node['page_rank'] = page_rank_sum
+            self.dangling_pr_mass += node['page_rank']
+            if frozen:
+                self.frozen_dangling_pr_mass += node['page_rank']
+
+        if frozen:
+            self.count('frozen nodes')
+            yield node_id, [node['page_rank']]
+        else:
+            self.count('active nodes')
             yield node_id, node
 
-    def complete_page_rank_reducer(self, node_id, dangling_nodes_contributions):
+    def map_adaptive_final(self):
         """
-        1. Sums up all the incoming contributions from the dangling nodes (emitted in previous reducer)
-        2. Properly updates the pagerank to take into account the damping factor and dangling mass
+        Same as map_page_rank_contribution_final, the contributions of the nodes which froze are sent as
+        ["frozen", <contribution>], and their dangling mass is reported separately as the driver keeps adding
+        it to the dangling mass of the next iterations
 
-        :param node_id:
-        :param dangling_nodes_contributions: either (<node id>, <dangling mass contribution>), (<node id>, <node structure>)
+        :return:
+        """
+        self.count('in-mapper combiner records out', len(self.frozen_page_ranks))
+        for node_id, page_rank_contribution in self.frozen_page_ranks.items():
+            yield node_id, ['frozen', page_rank_contribution]
+        self.increment_counter('page_rank', 'frozen_dangling_mass',
+                               int(round(self.frozen_dangling_pr_mass * COUNTER_SCALE)))
+        for pair in self.map_page_rank_contribution_final():
+            yield pair
+
+    def reduce_adaptive(self, node_id, values):
+        """
+        Same as reduce_incoming_page_rank_contributions, with the contributions of the frozen nodes
+        kept in the node structure ("frozen_page_rank") and added to the page rank in every iteration.
+        The page rank the node had before the iteration is always kept (in "previous_page_rank"),
+        so that the next mapper can tell whether the node converged.
+
+        A frozen node keeps it's page rank, the contributions it still gets from the active nodes are dropped.
+
+        :param node_id: node id
+        :param values: the node structure or the [<page rank>] of a frozen node, contributions and
+            ["frozen", <contribution>] of the nodes which froze in this iteration
         :return:
         """
         node = None
-        dangling_contribution = 0
-        for i, dangling_nodes_contribution in enumerate(dangling_nodes_contributions):
-            if isinstance(dangling_nodes_contribution, float):
-                dangling_contribution += dangling_nodes_contribution
+        frozen_node = None
+        page_rank_sum = 0
+        frozen_page_rank_sum = 0
+        for value in values:
+            if isinstance(value, float):
+                page_rank_sum += value
+            elif isinstance(value, dict):
+                node = value
+            elif value[0] == 'frozen':
+                frozen_page_rank_sum += value[1]
             else:
-                # this is the case where we send the actual node JSON structure
-                node = dangling_nodes_contribution
+                frozen_node = value
+
+        if node is None:
+            yield node_id, frozen_node
+            return
+        node['frozen_page_rank'] = node.get('frozen_page_rank', 0.0) + frozen_page_rank_sum
+        node['previous_page_rank'] = node['page_rank']
+        node['page_rank'] = page_rank_sum + node['frozen_page_rank']
+        yield node_id, node
+
+    def thaw_mapper(self, node_id, node):
+        """
+        Completes the page ranks of the active nodes (see corrected_page_rank), the nodes of the graph
+        (without "previous_page_rank") and the frozen nodes are passed on to thaw_reducer
+
+        :param node_id: node id
+        :param node: node structure of the last iteration or of the graph, or [<page rank>] of a frozen node
+        :return:
+        """
+        if isinstance(node, dict) and 'previous_page_rank' in node:
+            yield node_id, ['active', {'out_links': node['out_links'],
+                                       'page_rank': self.corrected_page_rank(node['page_rank'])}]
+        else:
+            yield node_id, node
+
+    def thaw_reducer(self, node_id, values):
+        """
+        Outputs the active nodes, and the frozen nodes with their out links from the graph
+
+        :param node_id: node id
+        :param values: the node of the graph and either the active node or the [<page rank>] of the frozen node
+        :return:
+        """
+        graph_node = None
+        node = None
+        for value in values:
+            if isinstance(value, dict):
+                graph_node = value
+            elif value[0] == 'active':
+                node = value[1]
+            else:
+                node = {'out_links': None, 'page_rank': value[0]}
+        if node['out_links'] is None:
+            node['out_links'] = graph_node['out_links']
+        yield node_id, node
 
-            # dangling nodes do not have the graph node structure
+    def complete_page_rank_mapper_init(self):
+        """
+        Initialises the sum of page rank changes and the dangling mass
+
+        :return:
+        """
+        self.page_rank_delta = 0
+        self.dangling_pr_mass = 0
+
+    def complete_page_rank_mapper(self, node_id, node):
+        """
+        Properly updates the pagerank to take into account the damping factor and dangling mass,
+        which the driver passes in --dangling_mass.
 
-        if node is not None:
-            old_page_rank = node['page_rank']
-            updated_page_rank = ((1 - self.options.damping_factor) / self.options.n_nodes) \
-                + (self.options.damping_factor * (dangling_contribution / self.options.n_nodes + old_page_rank))
-            node['page_rank'] = updated_page_rank
+        :param node_id: node id
+        :param node: node structure in JSON format
+        :return:
+        """
+        node['page_rank'] = self.corrected_page_rank(node['page_rank'])
+        self.track_page_rank_delta(node)
+        if not node['out_links']:
+            self.dangling_pr_mass += node['page_rank']
+        yield node_id, node
+
+    def complete_page_rank_mapper_final(self):
+        """
+        Reports the sum of page rank changes in this mapper and the dangling mass of the completed page ranks
+        (which the first round of --block_size starts from)
 
+        :return:
+        """
+        self.increment_counter('page_rank', 'dangling_mass', int(round(self.dangling_pr_mass * COUNTER_SCALE)))
+        self.increment_counter('page_rank', 'page_rank_delta', int(round(self.page_rank_delta * COUNTER_SCALE)))
+
+    def save_graph_reducer(self, node_id, nodes):
+        """
+        Outputs the completed nodes as they are. The shuffle sorts and partitions them like the adjacency phase,
+        so the saved graph can be read by --schimmy even if the nodes came in any order (e.g. from the blocks).
+
+        :param node_id: node id
+        :param nodes: the node structure
+        :return:
+        """
+        for node in nodes:
             yield node_id, node
+
+    def block_of(self, node_id):
+        """
+        With the range partitioner, nodes with consecutive ids share a block. The ids of crawled graphs
+        (like soc-Epinions1.txt) tend to follow the crawl, so more of the edges stay within the blocks
+        than with the hash partitioner.
+
+        :param node_id: node id (a string or an integer, depending on --node_protocol)
+        :return: the block of the node
+        """
+        if self.options.block_partitioner == 'range':
+            return int(node_id) // self.options.block_size
+        n_blocks = max(1, -(-self.options.n_nodes // self.options.block_size))
+        return zlib.crc32(str(node_id).encode('utf_8')) % n_blocks
+
+    def map_block_init(self):
+        """
+        Initialises the "in-mapper" combiner of the contributions to nodes of other blocks:
+            - {node_id: [sum of incoming page rank contributions from other blocks] , ...}
+
+        :return:
+        """
+        self.incoming_page_ranks = defaultdict(lambda: 0)
+
+    def map_block(self, node_id, node):
+        """
+        Sends the node structure to it's block. The contributions to nodes of the same block are left to
+        the inner iterations of the block, only the contributions to nodes of other blocks are combined
+        and sent to their blocks (see map_block_final).
+
+        The page ranks of the block phase are always complete, so there is no dangling mass to apply here.
+        They are only divided by the total page rank of the previous round (--page_rank_mass), as the rounds
+        don't add up to exactly 1 (see reduce_block).
+
+        :param node_id: node id
+        :param node: node structure with a complete page rank
+        :return: tuple of (block, ["node", node_id, node])
+        """
+        node['page_rank'] /= self.options.page_rank_mass
+        block = self.block_of(node_id)
+        if node['out_links']:
+            page_rank_contribution = node['page_rank'] / len(node['out_links'])
+            n_cross_block_edges = 0
+            for out_link_node_id in node['out_links']:
+                if self.block_of(out_link_node_id) != block:
+                    self.incoming_page_ranks[out_link_node_id] += page_rank_contribution
+                    n_cross_block_edges += 1
+            self.count('in-mapper combiner records in', n_cross_block_edges)
+            self.count('cross-block edges', n_cross_block_edges)
+            self.count('intra-block edges', len(node['out_links']) - n_cross_block_edges)
+        yield block, ['node', node_id, node]
+
+    def map_block_final(self):
+        """
+        Returns the combined contributions to nodes of other blocks
+
+        :return: tuples of (block, ["contribution", node_id, contribution])
+        """
+        self.count('in-mapper combiner records out', len(self.incoming_page_ranks))
+        for node_id, page_rank_contribution in self.incoming_page_ranks.items():
+            yield self.block_of(node_id), ['contribution', node_id, page_rank_contribution]
+
+    def reduce_block_init(self):
+        """
+        Initialises the dangling mass, the sum of page rank changes and the total page rank
+        of the blocks of this reducer
+
+        :return:
+        """
+        self.dangling_pr_mass = 0
+        self.page_rank_delta = 0
+        self.page_rank_mass = 0
+
+    def reduce_block(self, block, values):
+        """
+        Runs --inner_iterations of page rank over the nodes of the block held in memory.
+        The contributions from the other blocks are fixed for the round, while the contributions within the block
+        are recomputed in every inner iteration, so page rank moves several hops within the block per shuffle.
+
+        The dangling mass of the other blocks is the one of the previous round (--dangling_mass), the one of
+        this block is updated in every inner iteration. The page ranks are output complete, the dangling mass of
+        the block, the change of it's page ranks and their total are reported through counters
+        (see reduce_block_final).
+
+        As the blocks iterate with the contributions of the other blocks from the previous round, the page ranks
+        of a round don't add up to exactly 1. The next round renormalises them (see map_block), otherwise
+        the missing mass would only decay slowly.
+
+        :param block: block id
+        :param values: the nodes of the block and the contributions from other blocks
+        :return: tuples of (node_id, node)
+        """
+        nodes = {}
+        external_page_ranks = defaultdict(lambda: 0)
+        for kind, node_id, value in values:
+            if kind == 'node':
+                nodes[node_id] = value
+            else:
+                external_page_ranks[node_id] += value
+
+        previous_page_ranks = {node_id: node['page_rank'] for node_id, node in nodes.items()}
+        dangling_nodes = [node_id for node_id, node in nodes.items() if not node['out_links']]
+        intra_block_links = [(node_id, [out_link for out_link in node['out_links'] if out_link in nodes],
+                              len(node['out_links']))
+                             for node_id, node in nodes.items() if node['out_links']]
+        external_dangling_mass = self.options.dangling_mass \
+            - sum(previous_page_ranks[node_id] for node_id in dangling_nodes)
+
+        d = self.options.damping_factor
+        n = self.options.n_nodes
+        page_ranks = previous_page_ranks
+        for _ in range(self.options.inner_iterations):
+            dangling_mass = external_dangling_mass + sum(page_ranks[node_id] for node_id in dangling_nodes)
+            incoming_page_ranks = dict.fromkeys(nodes, 0)
+            for node_id, out_links, n_out_links in intra_block_links:
+                page_rank_contribution = page_ranks[node_id] / n_out_links
+                for out_link_node_id in out_links:
+                    incoming_page_ranks[out_link_node_id] += page_rank_contribution
+            page_ranks = {node_id: (1 - d) / n + d * (dangling_mass / n + incoming_page_rank
+                                                      + external_page_ranks.get(node_id, 0))
+                          for node_id, incoming_page_rank in incoming_page_ranks.items()}
+
+        self.count('blocks')
+        self.count('block nodes', len(nodes))
+        for node_id, node in nodes.items():
+            node['page_rank'] = page_ranks[node_id]
+            self.page_rank_delta += abs(node['page_rank'] - previous_page_ranks[node_id])
+            self.page_rank_mass += node['page_rank']
+            if not node['out_links']:
+                self.dangling_pr_mass += node['page_rank']
+            yield node_id, node
+
+    def reduce_block_final(self):
+        """
+        Reports the dangling mass, the sum of page rank changes and the total page rank of the blocks
+        of this reducer
+
+        :return:
+        """
+        self.increment_counter('page_rank', 'dangling_mass', int(round(self.dangling_pr_mass * COUNTER_SCALE)))
+        self.increment_counter('page_rank', 'page_rank_delta', int(round(self.page_rank_delta * COUNTER_SCALE)))
+        self.increment_counter('page_rank', 'page_rank_mass', int(round(self.page_rank_mass * COUNTER_SCALE)))
+
+    def load_seed_sets(self):
+        """
+        Reads the --seeds file, every seed set teleports to it's (distinct) seeds with the same probability:
+            - self.teleport = {node_id (as a string): [(seed set, 1 / number of seeds), ...], ...}
+
+        :return:
+        """
+        self.seed_sets = read_seed_sets(self.options.seeds)
+        self.teleport = defaultdict(list)
+        for seed_set, seeds in enumerate(self.seed_sets):
+            for seed in seeds:
+                self.teleport[seed].append((seed_set, 1 / len(seeds)))
+
+    def teleport_vector(self, node_id):
+        """
+        :param node_id: node id
+        :return: the probability of teleporting to the node, for every seed set
+        """
+        vector = [0.0] * len(self.seed_sets)
+        for seed_set, probability in self.teleport.get(str(node_id), ()):
+            vector[seed_set] = probability
+        return vector
+
+    def personalized_mapper_init(self):
+        """
+        Loads the seed sets and initialises the "in-mapper" combiner, which holds the sums of the incoming
+        contributions of every seed set:
+            - {node_id: [sum of incoming page rank contributions of every seed set] , ...}
+
+        :return:
+        """
+        self.load_seed_sets()
+        self.incoming_page_ranks = {}
+        self.dangling_pr_mass = [0.0] * len(self.seed_sets)
+
+    def personalized_mapper(self, node_id, node):
+        """
+        Same as map_page_rank_contribution, with a page rank per seed set: a single pass over the graph
+        (and a single shuffle of the graph structure) per iteration serves all of the seed sets.
+
+        The nodes of a new graph have a single page rank, they start from the teleport vector instead.
+
+        :param node_id: node id
+        :param node: node structure with a list of page ranks, one per seed set
+        :return:
+        """
+        if not isinstance(node['page_rank'], list):
+            node['page_rank'] = self.teleport_vector(node_id)
+        page_ranks = node['page_rank']
+        if node['out_links']:
+            page_rank_contributions = [page_rank / len(node['out_links']) for page_rank in page_ranks]
+            for out_link_node_id in node['out_links']:
+                incoming_page_ranks = self.incoming_page_ranks.get(out_link_node_id)
+                if incoming_page_ranks is None:
+                    self.incoming_page_ranks[out_link_node_id] = list(page_rank_contributions)
+                else:
+                    for seed_set, page_rank_contribution in enumerate(page_rank_contributions):
+                        incoming_page_ranks[seed_set] += page_rank_contribution
+            self.count('in-mapper combiner records in', len(node['out_links']))
         else:
-            # these are the 9 missing node id's in the range min_node_id to max_node_id
-            pass
+            for seed_set, page_rank in enumerate(page_ranks):
+                self.dangling_pr_mass[seed_set] += page_rank
+            self.count('dangling nodes')
+        yield node_id, node
 
-    def topN_mapper_init(self):
+    def personalized_mapper_final(self):
         """
-        Stores all the page ranks received in the mapper
+        Returns the combined contributions. The dangling mass of a seed set teleports to it's seeds,
+        so unlike the uniform page rank it's shuffled to the seeds instead of being passed through counters.
+        Every seed gets it's share even if it's 0, so that seeds missing from the graph are noticed by the reducer.
 
         :return:
         """
-        self.values = []
+        for seed, teleports in self.teleport.items():
+            contributions = [0.0] * len(self.seed_sets)
+            for seed_set, probability in teleports:
+                contributions[seed_set] = self.dangling_pr_mass[seed_set] * probability
+            yield seed, contributions
+        self.count('in-mapper combiner records out', len(self.incoming_page_ranks))
+        for node_id, page_rank_contributions in self.incoming_page_ranks.items():
+            yield node_id, page_rank_contributions
 
-    def topN_mapper(self, node_id, node):
+    def personalized_reducer_init(self):
         """
-        Reverts the order so that page ranks are keys.
-        This is used together with a custom comparator in the shuffle stage before the next reducer
+        Loads the seed sets and initialises the sum of page rank changes
 
-        :param node_id:
-        :param node:
         :return:
         """
-        self.values.append((node['page_rank'], node_id))
+        self.load_seed_sets()
+        self.page_rank_delta = 0
 
-    def topN_mapper_final(self):
+    def personalized_reducer(self, node_id, values):
         """
-        Returns N largest values based on page rank as (page rank, node id)
+        Sums up the contributions of every seed set and completes the page ranks right away, as the dangling mass
+        already got to the seeds: (1 - d) * teleport probability + d * sum of incoming contributions
 
+        :param node_id: node id
+        :param values: the node structure and lists of contributions
         :return:
         """
-        for pair in heapq.nlargest(n=self.options.top_n, iterable=self.values, key=lambda x: x[0]):
-            yield pair
+        node = None
+        page_rank_sums = [0.0] * len(self.seed_sets)
+        for value in values:
+            if isinstance(value, dict):
+                node = value
+            else:
+                for seed_set, page_rank_contribution in enumerate(value):
+                    page_rank_sums[seed_set] += page_rank_contribution
+        if node is None:
+            raise ValueError('Seed {} is not a node of the graph'.format(node_id))
+
+        d = self.options.damping_factor
+        page_ranks = [(1 - d) * probability + d * page_rank_sum
+                      for probability, page_rank_sum in zip(self.teleport_vector(node_id), page_rank_sums)]
+        self.page_rank_delta += sum(abs(page_rank - previous_page_rank)
+                                    for page_rank, previous_page_rank in zip(page_ranks, node['page_rank']))
+        node['page_rank'] = page_ranks
+        yield node_id, node
+
+    def personalized_reducer_final(self):
+        """
+        Reports the sum of page rank changes (over all of the seed sets) in this reducer
+
+        :return:
+        """
+        self.increment_counter('page_rank', 'page_rank_delta', int(round(self.page_rank_delta * COUNTER_SCALE)))
+
+    def personalized_topN_mapper_init(self):
+        """
+        Keeps a bounded min heap of the N largest (page rank, node id) pairs for every seed set
+
+        :return:
+        """
+        self.values = None
+
+    def personalized_topN_mapper(self, node_id, node):
+        """
+        :param node_id: node id
+        :param node: node structure with a list of page ranks, one per seed set
+        :return:
+        """
+        if self.values is None:
+            self.values = [[] for _ in node['page_rank']]
+        # like topN_mapper, the node id is output as a string whatever the --node_protocol
+        node_id = str(node_id)
+        for heap, page_rank in zip(self.values, node['page_rank']):
+            push_bounded(heap, (page_rank, node_id), self.options.top_n)
+
+    def personalized_topN_mapper_final(self):
+        """
+        Returns the N largest pairs of every seed set
 
-    def topN_reducer_init(self):
+        :return: tuples of (seed set, (page rank, node id))
         """
-        Keeps track of how many top page ranks were iterated over
+        for seed_set, heap in enumerate(self.values or []):
+            for pair in heap:
+                yield seed_set, pair
+
+    def personalized_topN_reducer(self, seed_set, pairs):
+        """
+        Outputs the top N nodes of the seed set along with their page ranks
+
+        :param seed_set: index of the seed set in --seeds
+        :param pairs: (page rank, node id) from every mapper
+        :return: tuples of (seed set, (page rank, node id)) by descending page rank
+        """
+        heap = []
+        for page_rank, node_id in pairs:
+            push_bounded(heap, (page_rank, node_id), self.options.top_n)
+        for pair in sorted(heap, reverse=True):
+            yield seed_set, pair
+
+    def walk_random(self, node_id):
+        """
+        :param node_id: node id
+        :return: random generator of the node in the current phase, so that the walks can be reproduced
+        """
+        return random.Random('{}:{}:{}'.format(self.options.walk_seed, self.options.walk_level, node_id))
+
+    def walk_groups(self):
+        """
+        :return: number of independent groups of the walks, walk i belongs to group i % walk_groups
+        """
+        return min(WALK_GROUPS, self.options.random_walks)
+
+    def start_walks_mapper_init(self):
+        """
+        Initialises the number of walks which are still alive and of the visits of the walks after their start
 
         :return:
         """
-        self.values = []
+        self.alive_walks = 0
+        self.walk_visits = 0
 
-    def topN_reducer(self, page_rank, node_ids):
+    def start_walks_mapper(self, node_id, node):
         """
-        Outputs the top N nodes along with their page ranks
+        Starts --random_walks walks from every node, each with it's first step. The walks are kept in the node
+        structure as segments [<end node>, [<visited nodes>]] (the start node isn't listed), the end node is
+        None once the walk stopped. A walk stops with probability 1 - damping factor at every step, and at
+        dangling nodes.
+
+        The visits of the walks which stop at dangling nodes (instead of jumping to any node) are proportional
+        to the page ranks, so the page ranks are estimated as the share of the visits of every node
+        (see walk_visits_reducer).
 
-        :param page_rank:
-        :param node_ids:
+        :param node_id: node id
+        :param node: node structure
         :return:
         """
-        for node_id in node_ids:
-            self.values.append((page_rank, node_id))
+        rng = self.walk_random(node_id)
+        walks = []
+        for _ in range(self.options.random_walks):
+            if node['out_links'] and rng.random() < self.options.damping_factor:
+                out_link_node_id = rng.choice(node['out_links'])
+                walks.append([out_link_node_id, [out_link_node_id]])
+                self.alive_walks += 1
+                self.walk_visits += 1
+            else:
+                walks.append([None, []])
+        node['walks'] = walks
+        yield node_id, node
 
-    def topN_reducer_final(self):
+    def start_walks_mapper_final(self):
         """
-        Returns N largest values based on page rank as (page rank, node id)
+        Reports the number of walks still alive and of their visits
 
         :return:
         """
-        for pair in heapq.nlargest(n=self.options.top_n, iterable=self.values, key=lambda x: x[0]):
-            yield pair
+        self.increment_counter('page_rank', 'alive_walks', self.alive_walks)
+        self.increment_counter('page_rank', 'walk_visits', self.walk_visits)
+
+    def request_walks_mapper(self, node_id, node):
+        """
+        First step of doubling the walks: every walk which is still alive requests a walk segment of it's end node
+
+        :param node_id: node id
+        :param node: node structure with the walks
+        :return: tuples of (node_id, ["node", node]) and (end node, ["request", node_id, index of the walk])
+        """
+        yield node_id, ['node', node]
+        for index, (end_node_id, _) in enumerate(node['walks']):
+            if end_node_id is not None:
+                yield end_node_id, ['request', node_id, index]
+
+    def reply_walks_reducer(self, node_id, values):
+        """
+        Replies to every request with one of the walks of this node (of the previous level) of the same group
+        (see walk_groups), taken in turns from a random offset so that the walks are reused as little as possible.
+        A reused walk still continues the requesting walk as a proper random walk, it only makes the walks
+        of the group correlated.
+
+        :param node_id: node id
+        :param values: the node structure and the requests
+        :return: tuples of (node_id, ["node", node]) and (requesting node, ["reply", index of the walk, walk])
+        """
+        node = None
+        requests = []
+        for value in values:
+            if value[0] == 'node':
+                node = value[1]
+            else:
+                requests.append(value[1:])
+        yield node_id, ['node', node]
+
+        walk_groups = self.walk_groups()
+        group_walks = [node['walks'][group::walk_groups] for group in range(walk_groups)]
+        rng = self.walk_random(node_id)
+        next_walks = [rng.randrange(len(walks)) for walks in group_walks]
+        for requesting_node_id, index in requests:
+            group = index % walk_groups
+            walks = group_walks[group]
+            self.count('walk replies')
+            yield requesting_node_id, ['reply', index, walks[next_walks[group] % len(walks)]]
+            next_walks[group] += 1
+
+    def join_walks_reducer_init(self):
+        """
+        Initialises the number of walks which are still alive and of the visits of the walks after their start
+
+        :return:
+        """
+        self.alive_walks = 0
+        self.walk_visits = 0
+
+    def join_walks_reducer(self, node_id, values):
+        """
+        Second step of doubling the walks: appends the replied segments to the walks which were still alive,
+        so the walks which are alive get twice as long in every level.
+
+        :param node_id: node id
+        :param values: the node structure and the replies
+        :return:
+        """
+        node = None
+        replies = []
+        for value in values:
+            if value[0] == 'node':
+                node = value[1]
+            else:
+                replies.append(value[1:])
+        for index, (end_node_id, visits) in replies:
+            node['walks'][index] = [end_node_id, node['walks'][index][1] + visits]
+
+        for end_node_id, visits in node['walks']:
+            if end_node_id is not None:
+                self.alive_walks += 1
+            self.walk_visits += len(visits)
+        yield node_id, node
+
+    def join_walks_reducer_final(self):
+        """
+        Reports the number of walks still alive and of their visits
+
+        :return:
+        """
+        self.increment_counter('page_rank', 'alive_walks', self.alive_walks)
+        self.increment_counter('page_rank', 'walk_visits', self.walk_visits)
+
+    def walk_visits_mapper_init(self):
+        """
+        Initialises the "in-mapper" combiner of the visits of the walks of every group (see walk_groups):
+            - {node_id: [number of visits of every group] , ...}
+
+        :return:
+        """
+        walk_groups = self.walk_groups()
+        self.visits = defaultdict(lambda: [0.0] * walk_groups)
+
+    def walk_visits_mapper(self, node_id, node):
+        """
+        Counts the visits of the walks of the node, including their start, and drops the walks
+
+        :param node_id: node id
+        :param node: node structure with the walks
+        :return:
+        """
+        walk_groups = self.walk_groups()
+        for index, (_, visits) in enumerate(node.pop('walks')):
+            group = index % walk_groups
+            self.visits[node_id][group] += 1
+            for visited_node_id in visits:
+                self.visits[visited_node_id][group] += 1
+            self.count('in-mapper combiner records in', len(visits) + 1)
+        yield node_id, node
+
+    def walk_visits_mapper_final(self):
+        """
+        Returns the combined visits
+
+        :return:
+        """
+        self.count('in-mapper combiner records out', len(self.visits))
+        for node_id, visits in self.visits.items():
+            yield node_id, visits
+
+    def walk_visits_reducer_init(self):
+        """
+        Initialises the sum of the variances of the estimated page ranks
+
+        :return:
+        """
+        self.page_rank_variance = 0
+
+    def walk_visits_reducer(self, node_id, values):
+        """
+        Estimates the page rank as the share of the visits of the node in all visits (--total_visits).
+
+        Every group of walks (see walk_groups) gives an independent estimate from about 1 / walk_groups
+        of the visits, the variance of the page rank is estimated from their spread and added up
+        in a counter (see log_walks_error).
+
+        :param node_id: node id
+        :param values: the node structure and numbers of visits of every group
+        :return:
+        """
+        node = None
+        group_visits = [0.0] * self.walk_groups()
+        for value in values:
+            if isinstance(value, dict):
+                node = value
+            else:
+                for group, visits in enumerate(value):
+                    group_visits[group] += visits
+        page_rank = sum(group_visits) / self.options.total_visits
+        walk_groups = len(group_visits)
+        if walk_groups > 1:
+            group_page_ranks = [visits * walk_groups / self.options.total_visits for visits in group_visits]
+            self.page_rank_variance += sum((group_page_rank - page_rank) ** 2 for group_page_rank in group_page_ranks) \
+                / (walk_groups - 1) / walk_groups
+        node['page_rank'] = page_rank
+        yield node_id, node
+
+    def walk_visits_reducer_final(self):
+        """
+        Reports the sum of the variances of the estimated page ranks in this reducer
+
+        :return:
+        """
+        self.increment_counter('page_rank', 'page_rank_variance', int(round(self.page_rank_variance * COUNTER_SCALE)))
+
+    def top_n_page_rank(self, node):
+        """
+        The top N completes the page ranks like the iterations (see corrected_page_rank)
+
+        :param node: node structure
+        :return: the complete page rank
+        """
+        return self.corrected_page_rank(node['page_rank'])
 
     def steps(self):
-        steps = [MRStep(reducer=self.convert_edge_list_to_adjacency_list_reducer)] \
-                + [ MRStep(reducer=self.convert_edge_list_to_adjacency_list_reducer_dangling)] \
-                + [
-                    MRStep(
-                        mapper_init=self.map_page_rank_contribution_init,
-                        mapper=self.map_page_rank_contribution,
-                        mapper_final=self.map_page_rank_contribution_final,
-                        reducer=self.reduce_incoming_page_rank_contributions
-                    ),
-                    MRStep(
-                        reducer=self.complete_page_rank_reducer)
-                ] * self.options.n_iterations \
-                + [MRStep(mapper_init=self.topN_mapper_init,
-                        mapper=self.topN_mapper,
-                        mapper_final=self.topN_mapper_final,
-                        reducer_init=self.topN_reducer_init,
-                        reducer=self.topN_reducer,
-                        reducer_final=self.topN_reducer_final,
-                        jobconf={
-                            'mapred.reduce.tasks': 1,
-                            'mapred.output.key.comparator.class': 'org.apache.hadoop.mapred.lib.KeyFieldBasedComparator',
-                            'mapred.text.key.comparator.options': '-k1,1nr'
-                        })
-                 ]
-
-        return steps
+        if self.options.phase == 'adjacency':
+            return [MRStep(mapper=self.edge_list_mapper,
+                           reducer=self.convert_edge_list_to_adjacency_list_reducer)]
+        elif self.options.phase == 'update':
+            return [MRStep(mapper_init=self.update_graph_mapper_init,
+                           mapper=self.update_graph_mapper,
+                           reducer=self.update_graph_reducer)]
+        elif self.options.phase == 'iteration' and self.options.schimmy:
+            return [MRStep(mapper_init=self.map_page_rank_contribution_init,
+                           mapper=self.map_page_rank_contribution,
+                           mapper_final=self.map_page_rank_contribution_final,
+                           reducer_init=self.reduce_page_rank_contributions_schimmy_init,
+                           reducer=self.reduce_page_rank_contributions_schimmy)]
+        elif self.options.phase == 'iteration':
+            return [MRStep(mapper_init=self.map_page_rank_contribution_init,
+                           mapper=self.map_page_rank_contribution,
+                           mapper_final=self.map_page_rank_contribution_final,
+                           reducer=self.reduce_incoming_page_rank_contributions)]
+        elif self.options.phase == 'complete':
+            return [MRStep(mapper_init=self.complete_page_rank_mapper_init,
+                           mapper=self.complete_page_rank_mapper,
+                           mapper_final=self.complete_page_rank_mapper_final)]
+        elif self.options.phase == 'save_graph':
+            return [MRStep(mapper_init=self.complete_page_rank_mapper_init,
+                           mapper=self.complete_page_rank_mapper,
+                           mapper_final=self.complete_page_rank_mapper_final,
+                           reducer=self.save_graph_reducer)]
+        elif self.options.phase == 'block':
+            return [MRStep(mapper_init=self.map_block_init,
+                           mapper=self.map_block,
+                           mapper_final=self.map_block_final,
+                           reducer_init=self.reduce_block_init,
+                           reducer=self.reduce_block,
+                           reducer_final=self.reduce_block_final)]
+        elif self.options.phase == 'personalized':
+            return [MRStep(mapper_init=self.personalized_mapper_init,
+                           mapper=self.personalized_mapper,
+                           mapper_final=self.personalized_mapper_final,
+                           reducer_init=self.personalized_reducer_init,
+                           reducer=self.personalized_reducer,
+                           reducer_final=self.personalized_reducer_final)]
+        elif self.options.phase == 'personalized_top_n':
+            return [MRStep(mapper_init=self.personalized_topN_mapper_init,
+                           mapper=self.personalized_topN_mapper,
+                           mapper_final=self.personalized_topN_mapper_final,
+                           reducer=self.personalized_topN_reducer)]
+        elif self.options.phase == 'walk_start':
+            return [MRStep(mapper_init=self.start_walks_mapper_init,
+                           mapper=self.start_walks_mapper,
+                           mapper_final=self.start_walks_mapper_final)]
+        elif self.options.phase == 'walk':
+            return [MRStep(mapper=self.request_walks_mapper,
+                           reducer=self.reply_walks_reducer),
+                    MRStep(reducer_init=self.join_walks_reducer_init,
+                           reducer=self.join_walks_reducer,
+                           reducer_final=self.join_walks_reducer_final)]
+        elif self.options.phase == 'walk_visits':
+            return [MRStep(mapper_init=self.walk_visits_mapper_init,
+                           mapper=self.walk_visits_mapper,
+                           mapper_final=self.walk_visits_mapper_final,
+                           reducer_init=self.walk_visits_reducer_init,
+                           reducer=self.walk_visits_reducer,
+                           reducer_final=self.walk_visits_reducer_final)]
+        elif self.options.phase == 'adaptive':
+            return [MRStep(mapper_init=self.map_adaptive_init,
+                           mapper=self.map_adaptive,
+                           mapper_final=self.map_adaptive_final,
+                           reducer=self.reduce_adaptive)]
+        elif self.options.phase == 'thaw':
+            return [MRStep(mapper=self.thaw_mapper,
+                           reducer=self.thaw_reducer)]
+        elif self.options.phase == 'top_n':
+            return self.top_n_steps()
+        raise ValueError('--phase is set by the driver (see run_driver)')
+
+    def run_job(self):
+        """
+        The job is driven from here instead of being submitted as a single job,
+        unless this is one of the jobs launched by the driver
+
+        :return:
+        """
+        if self.options.phase is None:
+            self.run_driver()
+        else:
+            super(MRPageRank, self).run_job()
+
+    def run_driver(self):
+        """
+        Runs page rank as a sequence of jobs:
+        1. builds the adjacency lists (phase "adjacency"), or with --previous_graph applies the edge changes
+            to the graph of a previous run (phase "update"), the iterations then start from the previous page ranks.
+            Either way, the number of nodes is read from a counter (unless it's given with --n_nodes)
+            and passed on to the other phases. With --graph, the graph and the number of nodes are taken
+            from a graph directory instead (see graph_format.py)
+        2. computes the page ranks, with one of:
+            - run_iterations, one job per iteration and one completing the page ranks
+            - run_fused_iterations (--fused), one job per iteration
+            - run_schimmy_iterations (--schimmy), either of them reading the graph structure from the first phase
+            - run_blocks (--block_size), one job per round of iterations within the blocks of the graph
+            - run_personalized (--seeds), one job per iteration updating the page ranks of all of the seed sets
+            - run_walks (--random_walks), a few jobs estimating the page ranks from random walks
+            - run_adaptive (--freeze_tolerance), one job per iteration updating only the nodes which didn't converge
+        3. with --graph_output_dir, completes the page ranks into that directory (phase "save_graph", which sorts
+            the nodes like the adjacency phase) and writes the manifest of the graph
+        4. outputs the top N nodes (phase "top_n"), with --seeds the top N nodes of every seed set
+            (phase "personalized_top_n") as lines of <seed set>\t[<page rank>, <node id>]
+
+        Either way, there is a single shuffle per iteration and the dangling mass is never shuffled.
+
+        With --tolerance, the L1 change of the page ranks is read from a counter after every iteration
+        and the driver stops early once it's below the tolerance (see converged).
+
+        Once finished, the counters of every phase are summarised (see instrumentation.py).
+
+        :return:
+        """
+        self.set_up_logging(quiet=self.options.quiet,
+                            verbose=self.options.verbose,
+                            stream=codecs.getwriter('utf_8')(self.stderr))
+        self.check_driver_options()
+
+        input_paths = self.options.args
+        job_args = [arg for arg in self._cl_args if arg not in input_paths]
+        self.intermediate_job_args = strip_output_dir_args(job_args)
+
+        node_protocol = self.options.node_protocol
+        saved_graph = self.options.graph or self.options.previous_graph
+        manifest = None
+        if saved_graph is not None:
+            manifest = read_manifest(saved_graph)
+            if manifest['node_protocol'] != node_protocol:
+                log.info('Using the node protocol of {}: {}'.format(saved_graph, manifest['node_protocol']))
+                node_protocol = manifest['node_protocol']
+                job_args = job_args + ['--node_protocol', node_protocol]
+                self.intermediate_job_args = self.intermediate_job_args + ['--node_protocol', node_protocol]
+
+        if self.options.graph is not None and input_paths:
+            log.warning('The input is ignored, the graph is read from --graph')
+
+        try:
+            n_nodes, n_edges, n_dangling_nodes, page_ranks = self.run_graph(input_paths, manifest)
+            runner = self.graph_runner
+            self.n_nodes = n_nodes
+            dangling_mass = None
+
+            log.info('Graph: {} nodes, {} edges, {} dangling nodes'.format(n_nodes, n_edges, n_dangling_nodes))
+            if self.options.n_nodes is None:
+                job_args = job_args + ['--n_nodes', str(n_nodes)]
+                self.intermediate_job_args = self.intermediate_job_args + ['--n_nodes', str(n_nodes)]
+            elif self.options.n_nodes != n_nodes:
+                log.warning('--n_nodes is {}, but the graph has {} nodes'.format(self.options.n_nodes, n_nodes))
+            if page_ranks == 'zero':
+                # the page ranks start from 0, see initial_page_rank
+                dangling_mass = 1.0
+
+            if self.options.seeds is not None:
+                run_page_rank = self.run_personalized
+            elif self.options.random_walks is not None:
+                run_page_rank = self.run_walks
+            elif self.options.freeze_tolerance is not None:
+                run_page_rank = self.run_adaptive
+            elif self.options.block_size is not None:
+                run_page_rank = self.run_blocks
+            elif self.options.schimmy:
+                run_page_rank = self.run_schimmy_iterations
+            elif self.options.fused:
+                run_page_rank = self.run_fused_iterations
+            else:
+                run_page_rank = self.run_iterations
+            runner, dangling_mass = run_page_rank(runner, dangling_mass)
+
+            if self.options.graph_output_dir is not None:
+                runner = self.run_next_phase('save graph', runner, with_dangling_mass(
+                    self.intermediate_job_args + ['--phase', 'save_graph', '--output-dir', self.options.graph_output_dir],
+                    dangling_mass))
+                dangling_mass = None
+
+            top_n_phase = 'top_n' if self.options.seeds is None else 'personalized_top_n'
+            final_runner = self.run_phase('top_n', self.output_paths(runner), with_dangling_mass(
+                job_args + ['--phase', top_n_phase], dangling_mass))
+            if self.options.graph_output_dir is not None:
+                # only once the top N phase has read the nodes, as the runners don't skip files starting with "_"
+                write_manifest(runner, node_protocol, 'complete', n_nodes, n_edges, n_dangling_nodes)
+            self.cleanup_runner(runner)
+            if self.graph_runner is not None:
+                self.graph_runner.cleanup()
+        except StepFailedException as e:
+            log.error(str(e))
+            sys.exit(1)
+
+        with final_runner:
+            if self._should_cat_output() and self.options.seeds is not None:
+                for line in to_lines(final_runner.cat_output()):
+                    self.stdout.write(line)
+                self.stdout.flush()
+            elif self.options.random_walks is not None:
+                top_n = io.BytesIO()
+                cat_top_n(final_runner, self.options.top_n, top_n)
+                log_walks_error(top_n.getvalue(), self.total_visits, self.page_rank_variance)
+                if self._should_cat_output():
+                    self.stdout.write(top_n.getvalue())
+                    self.stdout.flush()
+            elif self._should_cat_output():
+                cat_top_n(final_runner, self.options.top_n, self.stdout)
+        self.log_counters_summary()
+
+    def run_graph(self, input_paths, manifest):
+        """
+        Builds the adjacency lists (phase "adjacency"), or applies the edge changes to the --previous_graph
+        (phase "update"), or takes the --graph as it is. The graph is held by self.graph_runner
+        (None for the --graph, which is read from self.graph_paths) and it's directory is self.graph_dir.
+
+        :param input_paths: input paths of the driver
+        :param manifest: manifest of the --graph or --previous_graph (see graph_format.py), None otherwise
+        :return: (number of nodes, number of edges, number of dangling nodes, page ranks of the graph:
+            "uniform", "zero" or "complete", see graph_format.py)
+        """
+        self.graph_runner = None
+        self.graph_paths = None
+        if self.options.graph is not None:
+            # --schimmy reads the graph from the tasks
+            self.graph_dir = absolute_path(self.options.graph)
+            self.graph_paths = part_paths(self.graph_dir, manifest)
+            n_nodes, n_edges, n_dangling_nodes = manifest['n_nodes'], manifest['n_edges'], \
+                manifest['n_dangling_nodes']
+            page_ranks = manifest['page_ranks']
+        else:
+            if self.options.previous_graph is None:
+                self.graph_runner = self.run_phase(
+                    'adjacency', input_paths, self.intermediate_job_args + ['--phase', 'adjacency'])
+                page_ranks = 'zero' if self.options.n_nodes is None else 'uniform'
+            else:
+                self.graph_runner = self.run_phase(
+                    'update', part_paths(absolute_path(self.options.previous_graph), manifest) + input_paths,
+                    self.intermediate_job_args + ['--phase', 'update'])
+                # the new nodes start from 0, so a graph without page ranks ("zero") still gets them from
+                # the dangling mass of the first iteration
+                page_ranks = manifest['page_ranks']
+            self.graph_dir = self.graph_runner.get_output_dir()
+            n_nodes = read_counter(self.graph_runner, 'nodes', group=GROUP)
+            n_edges = read_counter(self.graph_runner, 'edges', group=GROUP)
+            n_dangling_nodes = read_counter(self.graph_runner, 'dangling nodes', group=GROUP, default=0)
+        return n_nodes, n_edges, n_dangling_nodes, page_ranks
+
+    def check_driver_options(self):
+        """
+        Rejects the combinations of the modes of the driver which aren't supported
+
+        :return:
+        """
+        if self.options.block_size is not None and self.options.schimmy:
+            raise ValueError('--schimmy is not supported with --block_size, the blocks shuffle the graph structure')
+        if self.options.random_walks is not None and (self.options.schimmy or self.options.block_size is not None
+                                                      or self.options.seeds is not None):
+            raise ValueError('--schimmy, --block_size and --seeds are not supported with --random_walks')
+        if self.options.freeze_tolerance is not None and (
+                self.options.schimmy or self.options.block_size is not None or self.options.seeds is not None
+                or self.options.random_walks is not None):
+            raise ValueError('--schimmy, --block_size, --seeds and --random_walks are not supported '
+                             'with --freeze_tolerance')
+        if self.options.seeds is not None and (self.options.schimmy or self.options.block_size is not None
+                                               or self.options.graph_output_dir is not None):
+            raise ValueError('--schimmy, --block_size and --graph_output_dir are not supported with --seeds')
+        if self.options.fused and (self.options.block_size is not None or self.options.freeze_tolerance is not None
+                                   or self.options.seeds is not None or self.options.random_walks is not None):
+            raise ValueError('--block_size, --freeze_tolerance, --seeds and --random_walks are not supported '
+                             'with --fused')
+
+    def run_iterations(self, runner, dangling_mass):
+        """
+        Runs one job per iteration (phase "iteration"), each reporting the mass of its dangling nodes in a counter.
+        The mass is passed on with --dangling_mass to a map only job which completes the page ranks
+        (phase "complete").
+
+        :param runner: runner which holds the graph
+        :param dangling_mass: dangling mass of the graph, None if it's page ranks are complete
+        :return: (runner which holds the nodes, their dangling mass)
+        """
+        for iteration in range(self.options.n_iterations):
+            runner = self.run_next_phase('iteration {}'.format(iteration + 1), runner, with_dangling_mass(
+                self.intermediate_job_args + ['--phase', 'iteration'], dangling_mass))
+            dangling_mass = read_counter(runner, 'dangling_mass') / COUNTER_SCALE
+            log.info('Iteration {}: dangling mass {}'.format(iteration + 1, dangling_mass))
+
+            runner = self.run_next_phase('complete {}'.format(iteration + 1), runner, with_dangling_mass(
+                self.intermediate_job_args + ['--phase', 'complete'], dangling_mass))
+            dangling_mass = None
+
+            if self.converged(runner, 'Iteration {}'.format(iteration + 1)):
+                log.info('Converged after {} iterations'.format(iteration + 1))
+                break
+        return runner, dangling_mass
+
+    def run_fused_iterations(self, runner, dangling_mass):
+        """
+        Like run_iterations, except that the dangling mass is passed directly to the next iteration,
+        which completes the page ranks in its mapper (see corrected_page_rank).
+
+        The change of an iteration is only known in the next one, so with --tolerance
+        it runs one iteration more than needed.
+
+        :param runner: runner which holds the graph
+        :param dangling_mass: dangling mass of the graph, None if it's page ranks are complete
+        :return: (runner which holds the nodes, their dangling mass)
+        """
+        for iteration in range(self.options.n_iterations):
+            runner = self.run_next_phase('iteration {}'.format(iteration + 1), runner, with_dangling_mass(
+                self.intermediate_job_args + ['--phase', 'iteration'], dangling_mass))
+            dangling_mass = read_counter(runner, 'dangling_mass') / COUNTER_SCALE
+            log.info('Iteration {}: dangling mass {}'.format(iteration + 1, dangling_mass))
+
+            # the mappers measure the change of the previous iteration
+            if iteration > 0 and self.converged(runner, 'Iteration {}'.format(iteration)):
+                log.info('Converged after {} iterations'.format(iteration + 1))
+                break
+        return runner, dangling_mass
+
+    def run_schimmy_iterations(self, runner, dangling_mass):
+        """
+        With --schimmy, the output of the adjacency phase (or the --graph) is kept until the end (see cleanup_runner)
+        and passed to the iterations with --graph_dir, so that they don't shuffle the graph structure
+        (see reduce_page_rank_contributions_schimmy). Otherwise the same as run_iterations or run_fused_iterations.
+
+        :param runner: runner which holds the graph
+        :param dangling_mass: dangling mass of the graph, None if it's page ranks are complete
+        :return: (runner which holds the nodes, their dangling mass)
+        """
+        self.intermediate_job_args = self.intermediate_job_args + ['--graph_dir', self.graph_dir]
+        if self.options.fused:
+            return self.run_fused_iterations(runner, dangling_mass)
+        return self.run_iterations(runner, dangling_mass)
+
+    def run_blocks(self, runner, dangling_mass):
+        """
+        With --block_size, the page ranks are completed once (phase "complete", which also measures
+        their dangling mass) and every round is a job (phase "block") which iterates within the blocks
+        of the graph, passing the dangling mass and the total page rank of the previous round
+        with --dangling_mass and --page_rank_mass (see map_block and reduce_block).
+
+        :param runner: runner which holds the graph
+        :param dangling_mass: dangling mass of the graph, None if it's page ranks are complete
+        :return: (runner which holds the nodes, None as their page ranks are complete)
+        """
+        runner = self.run_next_phase('complete', runner, with_dangling_mass(
+            self.intermediate_job_args + ['--phase', 'complete'], dangling_mass))
+        dangling_mass = read_counter(runner, 'dangling_mass') / COUNTER_SCALE
+        page_rank_mass = 1.0
+
+        for block_round in range(self.options.n_iterations):
+            runner = self.run_next_phase('block round {}'.format(block_round + 1), runner,
+                                         self.intermediate_job_args + ['--phase', 'block',
+                                                                       '--dangling_mass', repr(dangling_mass),
+                                                                       '--page_rank_mass', repr(page_rank_mass)])
+            # the next round renormalises the page ranks and their dangling mass (see reduce_block)
+            page_rank_mass = read_counter(runner, 'page_rank_mass') / COUNTER_SCALE
+            dangling_mass = read_counter(runner, 'dangling_mass') / COUNTER_SCALE / page_rank_mass
+            log.info('Block round {}: dangling mass {}, total page rank {}'.format(
+                block_round + 1, dangling_mass, page_rank_mass))
+
+            if self.converged(runner, 'Block round {}'.format(block_round + 1)) \
+                    and abs(1 - page_rank_mass) < self.options.tolerance:
+                log.info('Converged after {} block rounds'.format(block_round + 1))
+                break
+        # the block rounds output complete page ranks
+        return runner, None
+
+    def run_personalized(self, runner, dangling_mass):
+        """
+        With --seeds, every iteration is a job (phase "personalized") which updates the page ranks of all of the
+        seed sets at once and completes them in the reducer, as the dangling mass is shuffled to the seeds.
+
+        :param runner: runner which holds the graph
+        :param dangling_mass: ignored, the personalized page ranks start from the seeds
+        :return: (runner which holds the nodes, None as their page ranks are complete)
+        """
+        for iteration in range(self.options.n_iterations):
+            runner = self.run_next_phase('personalized iteration {}'.format(iteration + 1), runner,
+                                         self.intermediate_job_args + ['--phase', 'personalized'])
+
+            if self.converged(runner, 'Iteration {}'.format(iteration + 1)):
+                log.info('Converged after {} iterations'.format(iteration + 1))
+                break
+        return runner, None
+
+    def run_walks(self, runner, dangling_mass):
+        """
+        With --random_walks, the page ranks are estimated from random walks: the walks start with
+        one step (phase "walk_start") and every level (phase "walk", two steps) doubles the length of the walks
+        which are still alive, until all walks stopped. The visits are then counted (phase "walk_visits").
+        As the walks stop with probability 1 - damping factor at every step, this takes about
+        log2(log(walks) / log(1 / damping factor)) levels instead of tens of iterations.
+
+        The number of visits and the variance measured from the groups of walks are kept
+        for the error bound of the output (see log_walks_error).
+
+        :param runner: runner which holds the graph
+        :param dangling_mass: ignored, the walks don't need the page ranks
+        :return: (runner which holds the nodes, None as their page ranks are complete)
+        """
+        runner = self.run_next_phase('walk start', runner, self.intermediate_job_args + ['--phase', 'walk_start'])
+        alive_walks = read_counter(runner, 'alive_walks')
+
+        for walk_level in range(1, MAX_WALK_LEVELS + 1):
+            if alive_walks == 0:
+                break
+            runner = self.run_next_phase('walk level {}'.format(walk_level), runner, self.intermediate_job_args + [
+                '--phase', 'walk', '--walk_level', str(walk_level)])
+            alive_walks = read_counter(runner, 'alive_walks')
+            log.info('Walk level {}: {} walks are longer than {} steps'.format(
+                walk_level, alive_walks, 2 ** walk_level))
+        if alive_walks > 0:
+            log.warning('{} walks are cut after {} steps'.format(alive_walks, 2 ** MAX_WALK_LEVELS))
+
+        self.total_visits = self.n_nodes * self.options.random_walks + read_counter(runner, 'walk_visits')
+        runner = self.run_next_phase('walk visits', runner, self.intermediate_job_args + [
+            '--phase', 'walk_visits', '--total_visits', str(self.total_visits)])
+        self.page_rank_variance = read_counter(runner, 'page_rank_variance') / COUNTER_SCALE
+        return runner, None
+
+    def run_adaptive(self, runner, dangling_mass):
+        """
+        With --freeze_tolerance, every iteration is a job (phase "adaptive") which completes the page ranks in
+        the mapper like --fused, and stops updating the nodes which converged (see map_adaptive). The dangling
+        mass of the frozen nodes is added up by the driver. Once finished, the out links of the frozen nodes
+        are joined back from the graph (phase "thaw"), which is kept until then (see cleanup_runner).
+
+        :param runner: runner which holds the graph
+        :param dangling_mass: dangling mass of the graph, None if it's page ranks are complete
+        :return: (runner which holds the nodes, their dangling mass)
+        """
+        frozen_dangling_mass = 0.0
+        for iteration in range(self.options.n_iterations):
+            runner = self.run_next_phase('adaptive iteration {}'.format(iteration + 1), runner, with_dangling_mass(
+                self.intermediate_job_args + ['--phase', 'adaptive'], dangling_mass))
+            # the frozen nodes which are already compact don't report their dangling mass
+            dangling_mass = read_counter(runner, 'dangling_mass') / COUNTER_SCALE + frozen_dangling_mass
+            frozen_dangling_mass += read_counter(runner, 'frozen_dangling_mass') / COUNTER_SCALE
+            active_nodes = read_counter(runner, 'active nodes', group=GROUP, default=0)
+            log.info('Iteration {}: dangling mass {}, {} active nodes'.format(
+                iteration + 1, dangling_mass, active_nodes))
+            if active_nodes == 0:
+                log.info('All nodes are frozen after {} iterations'.format(iteration + 1))
+                break
+
+            # the mappers measure the change of the previous iteration
+            if iteration > 0 and self.converged(runner, 'Iteration {}'.format(iteration)):
+                log.info('Converged after {} iterations'.format(iteration + 1))
+                break
+
+        if runner is self.graph_runner:
+            return runner, dangling_mass
+        next_runner = self.run_phase('thaw', self.output_paths(runner) + self.output_paths(self.graph_runner),
+                                     with_dangling_mass(self.intermediate_job_args + ['--phase', 'thaw'],
+                                                        dangling_mass))
+        self.cleanup_runner(runner)
+        return next_runner, None
+
+    def converged(self, runner, name):
+        """
+        Reads the L1 change of the page ranks measured by the last job
+
+        :param runner: runner of the last job
+        :param name: name of the iteration in the log
+        :return: whether the change is below --tolerance (always False without --tolerance)
+        """
+        if self.options.tolerance is None:
+            return False
+        page_rank_delta = read_counter(runner, 'page_rank_delta') / COUNTER_SCALE
+        log.info('{}: page rank change {}'.format(name, page_rank_delta))
+        return page_rank_delta < self.options.tolerance
+
+    def run_next_phase(self, name, runner, args):
+        """
+        Runs a phase of the driver on the output of the previous one, which is then cleaned up
+
+        :param name: name of the phase in the summary of the counters (see instrumentation.py)
+        :param runner: runner of the previous phase, None for the --graph
+        :param args: command line arguments (without input paths)
+        :return: the runner which holds the job output
+        """
+        next_runner = self.run_phase(name, self.output_paths(runner), args)
+        self.cleanup_runner(runner)
+        return next_runner
+
+    def output_paths(self, runner):
+        """
+        :param runner: runner of a phase, None for the --graph
+        :return: the input paths of the next phase
+        """
+        # the first iteration of a --graph reads it's parts
+        return self.graph_paths if runner is None else [runner.get_output_dir()]
+
+    def cleanup_runner(self, runner):
+        """
+        Cleans up the output of a phase once the next one has read it, except for the graph
+        which is still needed with --schimmy and --freeze_tolerance
+
+        :param runner: runner of a phase, None for the --graph
+        :return:
+        """
+        # with --schimmy, every iteration reads the output of the adjacency phase,
+        # with --freeze_tolerance, it's needed to restore the out links of the frozen nodes
+        keep_graph = self.options.schimmy or self.options.freeze_tolerance is not None
+        if runner is not None and not (keep_graph and runner is self.graph_runner):
+            runner.cleanup()
+
+    def run_phase(self, name, input_paths, args):
+        """
+        Runs a single phase of the driver, the caller is responsible for cleaning up the runner.
+
+        :param name: name of the phase in the summary of the counters (see instrumentation.py)
+        :param input_paths: input paths of the job
+        :param args: command line arguments (without input paths)
+        :return: the runner which holds the job output
+        """
+        runner = self.__class__(args=list(input_paths) + args).make_runner()
+        runner.run()
+        self.add_runner(name, runner)
+        return runner
+
+
+def with_dangling_mass(args, dangling_mass):
+    """
+    :param args: command line arguments of a phase
+    :param dangling_mass: dangling mass of the input of the phase, None if it's page ranks are complete
+    :return: the arguments with --dangling_mass
+    """
+    if dangling_mass is None:
+        return args
+    return args + ['--dangling_mass', repr(dangling_mass)]
+
+
+def strip_output_dir_args(args):
+    """
+    Removes --output-dir (-o) from the command line arguments
+    so that the intermediate jobs write into temporary directories
+
+    :param args: command line arguments
+    :return: arguments without the output dir
+    """
+    stripped_args = []
+    skip_next = False
+    for arg in args:
+        if skip_next:
+            skip_next = False
+        elif arg in ('--output-dir', '-o'):
+            skip_next = True
+        elif not arg.startswith('--output-dir='):
+            stripped_args.append(arg)
+    return stripped_args
+
+
+def log_walks_error(top_n, total_visits, page_rank_variance):
+    """
+    Logs the error bound of the page ranks estimated from the random walks. If the visits were independent,
+    they would be Poisson distributed and the variance of an estimated page rank p would be p / total visits,
+    which adds up to 1 / total visits over all nodes. The walks visit nodes repeatedly and reuse segments,
+    so the variances are scaled by how much larger the variance measured from the groups of walks is
+    (see walk_visits_reducer). The bound is two standard errors.
+
+    :param top_n: lines of the top N output (<page rank>\t<node id>)
+    :param total_visits: number of visits of all of the walks
+    :param page_rank_variance: sum of the variances of the page ranks measured from the groups of walks,
+        0 if there is a single group
+    :return:
+    """
+    protocol = JSONProtocol()
+    page_ranks = [protocol.read(line)[0] for line in top_n.splitlines() if line]
+    if not page_ranks:
+        return
+    variance_factor = max(1.0, page_rank_variance * total_visits)
+    errors = [2 * math.sqrt(variance_factor * page_rank / total_visits) for page_rank in page_ranks]
+    log.info('Random walks: {} visits, the top {} page ranks are within +-{:.3g} (+-{:.1%} of the last one), '
+             'the variance is {:.2f} times the one of independent visits'.format(
+                 total_visits, len(page_ranks), max(errors),
+                 errors[-1] / page_ranks[-1] if page_ranks[-1] else float('inf'), variance_factor))
+
+
+def read_seed_sets(path):
+    """
+    :param path: path of the --seeds file
+    :return: list of seed sets, every seed set is a list of distinct node ids (as strings)
+    """
+    with open(path) as f:
+        seed_sets = [list(dict.fromkeys(line.split())) for line in f if line.strip()]
+    if not seed_sets:
+        raise ValueError('{} has no seed sets'.format(path))
+    return seed_sets
+
+
+def read_counter(runner, counter, group='page_rank', default=None):
+    """
+    Reads a counter of the last step run by the runner
+
+    :param runner: a runner that finished
+    :param counter: counter name
+    :param group: counter group
+    :param default: value of a counter which is only missing if it was never incremented
+    :return: the counter value
+    """
+    counters = runner.counters()
+    if counters and default is not None and group in counters[-1]:
+        return counters[-1][group].get(counter, default)
+    if not counters or counter not in counters[-1].get(group, {}):
+        raise ValueError('Counter {}.{} is missing, counters are required by the driver '
+                         '(don\'t use --no-read-logs)'.format(group, counter))
+    return counters[-1][group][counter]
 
 
 if __name__ == '__main__':
@@ -0,0 +1,300 @@
+"""
+Single machine page rank for graphs that fit into memory (e.g. soc-Epinions1 with 75k nodes and 500k edges).
+
+Computes the same page ranks as page_rank_complete.py (including the damping factor and the dangling nodes)
+with NumPy instead of MapReduce, takes the same options and outputs the top N nodes in the same format:
+    <page rank>\t"<node id>"
+
+With --processes, the iterations are split over worker processes which keep their part of the graph in memory
+and exchange the page ranks through shared memory (see parallel_page_rank), instead of the temp files
+between the steps of the local mrjob runners.
+
+Usage:
+    python page_rank_local.py data/soc-Epinions1.txt --n_iterations=50 --damping_factor=0.85 --top_n=10
+    python page_rank_local.py data/soc-Epinions1.txt --n_iterations=50 --processes=0
+"""
+from multiprocessing import Pipe, Process, shared_memory
+import argparse
+import heapq
+import json
+import os
+import sys
+
+import numpy as np
+
+# seconds to wait for a worker to stop before terminating it
+WORKER_STOP_TIMEOUT = 10
+
+
+def read_edge_list(paths):
+    """
+    Reads the tab separated edge lists (lines starting with "#" are ignored)
+
+    :param paths: paths of the edge list files
+    :return: arrays of (source node ids, target node ids)
+    """
+    chunks = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            lines = [line for line in f.read().splitlines() if line and not line.startswith(b'#')]
+        chunks.append(np.array(b' '.join(lines).split(), dtype=np.int64))
+    edges = np.concatenate(chunks).reshape(-1, 2)
+    return edges[:, 0], edges[:, 1]
+
+
+class Graph(object):
+    """
+    The graph as arrays over node indexes 0..n_nodes - 1:
+    - node_ids - node id of every index
+    - sources, targets - the edges, duplicate edges are kept once (like in the MapReduce jobs)
+    - out_degrees - number of outgoing links of every node
+    """
+
+    def __init__(self, source_ids, target_ids):
+        self.node_ids, indexes = np.unique(np.concatenate([source_ids, target_ids]), return_inverse=True)
+        self.n_nodes = len(self.node_ids)
+        edges = np.unique(indexes.reshape(2, -1), axis=1)
+        self.sources = edges[0]
+        self.targets = edges[1]
+        self.out_degrees = np.bincount(self.sources, minlength=self.n_nodes)
+        self.dangling = self.out_degrees == 0
+
+
+def iterate_page_rank(graph, page_rank, damping_factor, n_nodes):
+    """
+    A single iteration of page rank, same as page_rank_complete.py:
+        (1 - d) / n + d * (sum of incoming contributions + dangling mass / n)
+
+    :param graph: Graph
+    :param page_rank: page ranks of the previous iteration
+    :param damping_factor: the damping factor
+    :param n_nodes: number of nodes used for the teleportation and the dangling mass
+    :return: the new page ranks
+    """
+    contributions = page_rank / np.maximum(graph.out_degrees, 1)
+    incoming = np.bincount(graph.targets, weights=contributions[graph.sources], minlength=graph.n_nodes)
+    dangling_mass = page_rank[graph.dangling].sum()
+    return (1 - damping_factor) / n_nodes + damping_factor * (incoming + dangling_mass / n_nodes)
+
+
+def page_rank(graph, n_iterations, damping_factor, n_nodes=None, tolerance=None):
+    """
+    Runs the page rank iterations starting from 1 / n_nodes
+
+    :param graph: Graph
+    :param n_iterations: (maximal) number of iterations
+    :param damping_factor: the damping factor
+    :param n_nodes: number of nodes, defaults to the number of nodes in the graph
+    :param tolerance: stop once the L1 change of an iteration is below this value
+    :return: page ranks indexed like graph.node_ids
+    """
+    n_nodes = n_nodes or graph.n_nodes
+    ranks = np.full(graph.n_nodes, 1 / n_nodes)
+    for iteration in range(n_iterations):
+        new_ranks = iterate_page_rank(graph, ranks, damping_factor, n_nodes)
+        delta = np.abs(new_ranks - ranks).sum()
+        ranks = new_ranks
+        if tolerance is not None and delta < tolerance:
+            break
+    return ranks
+
+
+def partition_bounds(graph, n_partitions):
+    """
+    Splits the node indexes into ranges with about the same number of nodes and outgoing edges
+
+    :param graph: Graph
+    :param n_partitions: number of ranges
+    :return: n_partitions + 1 bounds, range i is bounds[i]..bounds[i + 1] - 1
+    """
+    work = np.cumsum(graph.out_degrees + 1)
+    inner_bounds = np.searchsorted(work, work[-1] * np.arange(1, n_partitions) / n_partitions)
+    return [0] + [int(bound) for bound in inner_bounds] + [graph.n_nodes]
+
+
+def create_shared_array(shape):
+    """
+    :param shape: shape of the array
+    :return: (SharedMemory, float64 array of zeros in it)
+    """
+    memory = shared_memory.SharedMemory(create=True, size=max(8, int(np.prod(shape)) * 8))
+    array = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+    array[:] = 0
+    return memory, array
+
+
+def serve_partition(connection, shared, partition, first_node, sources, targets, out_degrees, dangling,
+                    damping_factor, n_nodes):
+    """
+    Worker process of parallel_page_rank, holds the out links of the node range of it's partition and runs
+    the commands received on the connection:
+    - "map" - adds up the contributions of the edges of the partition to every node, like the "in-mapper"
+        combiner of page_rank_complete.py, into it's row of the incoming array, and the dangling mass of the range
+    - "reduce" - sums up the rows of the incoming array for the node range and updates it's page ranks
+        (with the damping factor and the total dangling mass), together with the L1 change of the range
+    - "stop"
+
+    :param connection: end of a Pipe, every command is acknowledged by sending it back
+    :param shared: {name: (shared memory name, shape)} of the ranks, incoming and sums arrays
+    :param partition: index of the partition
+    :param first_node: first node index of the range
+    :param sources: node indexes of the sources of the edges, relative to first_node
+    :param targets: node indexes of the targets of the edges
+    :param out_degrees: number of outgoing links of the nodes of the range
+    :param dangling: whether the nodes of the range are dangling
+    :param damping_factor: the damping factor
+    :param n_nodes: number of nodes used for the teleportation and the dangling mass
+    :return:
+    """
+    memories = {name: shared_memory.SharedMemory(name=memory_name) for name, (memory_name, _) in shared.items()}
+    try:
+        ranks, incoming, sums = [np.ndarray(shared[name][1], dtype=np.float64, buffer=memories[name].buf)
+                                 for name in ('ranks', 'incoming', 'sums')]
+        last_node = first_node + len(out_degrees)
+        edge_weights = 1 / out_degrees[sources]
+        sources = sources + first_node
+        while True:
+            command = connection.recv()
+            if command == 'map':
+                incoming[partition] = np.bincount(targets, weights=ranks[sources] * edge_weights,
+                                                  minlength=incoming.shape[1])
+                sums[partition, 0] = ranks[first_node:last_node][dangling].sum()
+            elif command == 'reduce':
+                new_ranks = (1 - damping_factor) / n_nodes + damping_factor * (
+                    incoming[:, first_node:last_node].sum(axis=0) + sums[:, 0].sum() / n_nodes)
+                sums[partition, 1] = np.abs(new_ranks - ranks[first_node:last_node]).sum()
+                ranks[first_node:last_node] = new_ranks
+            else:
+                break
+            connection.send(command)
+    finally:
+        for memory in memories.values():
+            memory.close()
+
+
+def parallel_page_rank(graph, n_processes, n_iterations, damping_factor, n_nodes=None, tolerance=None):
+    """
+    Same as page_rank, with the graph split into node ranges (see partition_bounds) held by worker processes
+    (see serve_partition). Every iteration is a "map" over the edges of every range followed by a "reduce"
+    of the node ranges, with the page ranks and the contributions in shared memory arrays, so nothing
+    is serialised between the iterations.
+
+    :param graph: Graph
+    :param n_processes: number of worker processes
+    :param n_iterations: (maximal) number of iterations
+    :param damping_factor: the damping factor
+    :param n_nodes: number of nodes, defaults to the number of nodes in the graph
+    :param tolerance: stop once the L1 change of an iteration is below this value
+    :return: page ranks indexed like graph.node_ids
+    """
+    n_nodes = n_nodes or graph.n_nodes
+    bounds = partition_bounds(graph, n_processes)
+    edge_bounds = np.searchsorted(graph.sources, bounds)
+    memories = []
+    connections = []
+    workers = []
+    try:
+        shared = {}
+        arrays = {}
+        for name, shape in (('ranks', (graph.n_nodes,)), ('incoming', (n_processes, graph.n_nodes)),
+                            ('sums', (n_processes, 2))):
+            memory, arrays[name] = create_shared_array(shape)
+            memories.append(memory)
+            shared[name] = (memory.name, shape)
+        ranks, sums = arrays['ranks'], arrays['sums']
+        ranks[:] = 1 / n_nodes
+
+        for partition in range(n_processes):
+            first_node, last_node = bounds[partition], bounds[partition + 1]
+            first_edge, last_edge = edge_bounds[partition], edge_bounds[partition + 1]
+            connection, worker_connection = Pipe()
+            worker = Process(target=serve_partition, daemon=True, args=(
+                worker_connection, shared, partition, first_node,
+                graph.sources[first_edge:last_edge] - first_node, graph.targets[first_edge:last_edge],
+                graph.out_degrees[first_node:last_node], graph.dangling[first_node:last_node],
+                damping_factor, n_nodes))
+            worker.start()
+            connections.append(connection)
+            workers.append(worker)
+
+        def run_command(command):
+            for connection in connections:
+                connection.send(command)
+            for connection in connections:
+                if connection.recv() != command:
+                    raise RuntimeError('A worker failed to run {}'.format(command))
+
+        for iteration in range(n_iterations):
+            run_command('map')
+            run_command('reduce')
+            if tolerance is not None and sums[:, 1].sum() < tolerance:
+                break
+        return ranks.copy()
+    finally:
+        # a worker which failed has closed it's end of the pipe, which mustn't hide the original exception
+        # nor leave the shared memory behind
+        for connection in connections:
+            try:
+                connection.send('stop')
+            except OSError:
+                pass
+        for worker in workers:
+            worker.join(timeout=WORKER_STOP_TIMEOUT)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+        for memory in memories:
+            try:
+                memory.close()
+            finally:
+                memory.unlink()
+
+
+def top_n(graph, ranks, n):
+    """
+    :return: the N largest values based on page rank as (page rank, node id)
+    """
+    return heapq.nlargest(n, zip(ranks.tolist(), graph.node_ids.tolist()), key=lambda x: x[0])
+
+
+def configure_args():
+    """
+    Same options as page_rank_complete.py, except that n_nodes is computed from the graph by default
+
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='In memory page rank')
+    parser.add_argument('args', nargs='+', help='edge list files')
+    parser.add_argument(
+        '--n_iterations', type=int, default=10, help='Number of iterations of page rank to run')
+    parser.add_argument(
+        '--damping_factor', type=float, default=0.85, help='The damping factor using in the calculations')
+    parser.add_argument(
+        '--n_nodes', type=int, default=None, help='Number of nodes in the graph (computed from the graph by default)')
+    parser.add_argument(
+        '--top_n', type=int, default=10, help='Number of top pages to output')
+    parser.add_argument(
+        '--tolerance', type=float, default=None,
+        help='Stop once the sum of absolute page rank changes of an iteration is below this value')
+    parser.add_argument(
+        '--processes', type=int, default=1,
+        help='Number of worker processes (0 uses every core), see parallel_page_rank')
+    return parser
+
+
+def main(args=None):
+    options = configure_args().parse_args(args)
+    graph = Graph(*read_edge_list(options.args))
+    n_processes = options.processes or os.cpu_count()
+    if n_processes > 1:
+        ranks = parallel_page_rank(graph, n_processes, options.n_iterations, options.damping_factor,
+                                   n_nodes=options.n_nodes, tolerance=options.tolerance)
+    else:
+        ranks = page_rank(graph, options.n_iterations, options.damping_factor,
+                          n_nodes=options.n_nodes, tolerance=options.tolerance)
+    for rank, node_id in top_n(graph, ranks, options.top_n):
+        sys.stdout.write('{}\t{}\n'.format(json.dumps(rank), json.dumps(str(node_id))))
+
+
+if __name__ == '__main__':
+    main()
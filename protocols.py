@@ -0,0 +1,166 @@
+"""
+Compact protocols for the page rank node structure ({out_links = [a,b,c], page_rank = pr}).
+
+Keys are node ids written as plain integers. Values are either:
+- a page rank contribution (float) -> "c" + 8 byte float
+- a node structure -> "n" + 8 byte float page rank + the out links
+- a node structure with a previous page rank (see --tolerance) -> "m" + 2 floats + the out links
+- a node structure with a previous page rank and the contributions of frozen nodes (see --freeze_tolerance)
+    -> "a" + 3 floats + the out links
+- a list of page ranks or contributions (see --seeds) -> "v" + the floats
+- a node structure with a list of page ranks (see --seeds) -> "p" + number of page ranks + the floats + the out links
+- anything else -> "j" + JSON (used for values that don't fit the above, nothing is lost)
+
+The binary part is base64 encoded so the lines can still go through Hadoop streaming.
+Node ids have to be non-negative integers, they are decoded as int's.
+"""
+from array import array
+import base64
+import json
+import struct
+import sys
+
+from mrjob.protocol import JSONProtocol
+
+FLOAT = struct.Struct('<d')
+TWO_FLOATS = struct.Struct('<dd')
+THREE_FLOATS = struct.Struct('<ddd')
+UINT32 = struct.Struct('<I')
+NODE_KEYS = {'out_links', 'page_rank'}
+TRACKED_NODE_KEYS = {'out_links', 'page_rank', 'previous_page_rank'}
+ADAPTIVE_NODE_KEYS = {'out_links', 'page_rank', 'previous_page_rank', 'frozen_page_rank'}
+
+
+class PackedNodeProtocol(object):
+    """
+    Encodes the out links as an array of little endian int32's, (de)serialisation of the array is done in C
+    """
+
+    def read(self, line):
+        raw_key, raw_value = line.split(b'\t', 1)
+        tag = raw_value[:1]
+        if tag == b'j':
+            return int(raw_key), json.loads(raw_value[1:].decode('utf_8'))
+
+        data = base64.b64decode(raw_value[1:])
+        if tag == b'c':
+            return int(raw_key), FLOAT.unpack(data)[0]
+        elif tag == b'v':
+            return int(raw_key), self.decode_floats(data)
+        elif tag == b'p':
+            n_page_ranks = UINT32.unpack_from(data)[0]
+            out_links_start = UINT32.size + n_page_ranks * FLOAT.size
+            return int(raw_key), {'out_links': self.decode_out_links(data[out_links_start:]),
+                                  'page_rank': self.decode_floats(data[UINT32.size:out_links_start])}
+        elif tag == b'a':
+            page_rank, previous_page_rank, frozen_page_rank = THREE_FLOATS.unpack_from(data)
+            return int(raw_key), {'out_links': self.decode_out_links(data[THREE_FLOATS.size:]),
+                                  'page_rank': page_rank,
+                                  'previous_page_rank': previous_page_rank,
+                                  'frozen_page_rank': frozen_page_rank}
+        elif tag == b'm':
+            page_rank, previous_page_rank = TWO_FLOATS.unpack_from(data)
+            return int(raw_key), {'out_links': self.decode_out_links(data[TWO_FLOATS.size:]),
+                                  'page_rank': page_rank,
+                                  'previous_page_rank': previous_page_rank}
+        return int(raw_key), {'out_links': self.decode_out_links(data[FLOAT.size:]),
+                              'page_rank': FLOAT.unpack_from(data)[0]}
+
+    def write(self, key, value):
+        raw_key = str(int(key)).encode('utf_8')
+        if isinstance(value, float):
+            return raw_key + b'\tc' + base64.b64encode(FLOAT.pack(value))
+        elif is_float_list(value):
+            return raw_key + b'\tv' + base64.b64encode(self.encode_floats(value))
+        elif isinstance(value, dict) and value.keys() == NODE_KEYS and is_float_list(value['page_rank']):
+            data = UINT32.pack(len(value['page_rank'])) + self.encode_floats(value['page_rank']) \
+                + self.encode_out_links(value['out_links'])
+            return raw_key + b'\tp' + base64.b64encode(data)
+        elif isinstance(value, dict) and value.keys() == NODE_KEYS and isinstance(value['page_rank'], float):
+            data = FLOAT.pack(value['page_rank']) + self.encode_out_links(value['out_links'])
+            return raw_key + b'\tn' + base64.b64encode(data)
+        elif isinstance(value, dict) and value.keys() == TRACKED_NODE_KEYS and isinstance(value['page_rank'], float):
+            data = TWO_FLOATS.pack(value['page_rank'], value['previous_page_rank']) \
+                + self.encode_out_links(value['out_links'])
+            return raw_key + b'\tm' + base64.b64encode(data)
+        elif isinstance(value, dict) and value.keys() == ADAPTIVE_NODE_KEYS \
+                and all(isinstance(value[key], float) for key in ('page_rank', 'previous_page_rank', 'frozen_page_rank')):
+            data = THREE_FLOATS.pack(value['page_rank'], value['previous_page_rank'], value['frozen_page_rank']) \
+                + self.encode_out_links(value['out_links'])
+            return raw_key + b'\ta' + base64.b64encode(data)
+        return raw_key + b'\tj' + json.dumps(value).encode('utf_8')
+
+    def encode_floats(self, values):
+        values = array('d', values)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values.tobytes()
+
+    def decode_floats(self, data):
+        values = array('d')
+        values.frombytes(data)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values.tolist()
+
+    def encode_out_links(self, out_links):
+        out_links = array('i', [int(out_link) for out_link in out_links])
+        if sys.byteorder == 'big':
+            out_links.byteswap()
+        return out_links.tobytes()
+
+    def decode_out_links(self, data):
+        out_links = array('i')
+        out_links.frombytes(data)
+        if sys.byteorder == 'big':
+            out_links.byteswap()
+        return out_links.tolist()
+
+
+class VarintNodeProtocol(PackedNodeProtocol):
+    """
+    Sorts the out links and encodes the gaps between them as varints (7 bits per byte),
+    which is smaller than PackedNodeProtocol but costs more CPU as it's done in Python
+    """
+
+    def encode_out_links(self, out_links):
+        data = bytearray()
+        previous = 0
+        for out_link in sorted(int(out_link) for out_link in out_links):
+            gap = out_link - previous
+            previous = out_link
+            while gap >= 0x80:
+                data.append((gap & 0x7f) | 0x80)
+                gap >>= 7
+            data.append(gap)
+        return bytes(data)
+
+    def decode_out_links(self, data):
+        out_links = []
+        previous = 0
+        gap = 0
+        shift = 0
+        for byte in data:
+            gap |= (byte & 0x7f) << shift
+            if byte & 0x80:
+                shift += 7
+            else:
+                previous += gap
+                out_links.append(previous)
+                gap = 0
+                shift = 0
+        return out_links
+
+
+def is_float_list(value):
+    """
+    :return: whether the value is a non empty list of floats, which is encoded without loss as an array of doubles
+    """
+    return isinstance(value, list) and len(value) > 0 and all(isinstance(item, float) for item in value)
+
+
+NODE_PROTOCOLS = {
+    'json': JSONProtocol,
+    'packed': PackedNodeProtocol,
+    'varint': VarintNodeProtocol,
+}
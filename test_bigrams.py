@@ -1,7 +1,7 @@
 import nltk
-import re
 import operator
 import pandas as pd
+from tokenizer import bigrams as document_bigrams
 
 
 """
@@ -12,10 +12,9 @@ bigrams = []
 df = pd.read_csv('data/shortjokes.csv', sep=',', header=0)
 data = df["Joke"].to_list()
 for content in data:
-    words = re.sub('\s+', ' ', re.sub('[^a-z]+', ' ', re.sub('\'', '', content.lower()))).strip(' ').split(" ")
-    for i in range(0, len(words) - 1):
-        bigrams.append((words[i], words[i + 1]))
-        bigrams.append((words[i], "*"))
+    for word, following_word in document_bigrams(content):
+        bigrams.append((word, following_word))
+        bigrams.append((word, "*"))
 
 count_all = 0
 fdist = nltk.FreqDist(bigrams)
@@ -7,7 +7,7 @@ files = os.listdir(folder)
 
 sum = 0
 for file in files:
-    if not file.startswith("."):
+    if not file.startswith((".", "_")):
         path = Path(folder, file)
         print(path)
         with open(path) as f:
@@ -0,0 +1,237 @@
+"""
+Runs the driver of page_rank_complete.py in every mode on a tiny graph with the inline runner,
+and compares the page ranks with page_rank_local.py (or networkx for --seeds), no data needed:
+    python -m pytest test_page_rank_complete.py
+"""
+import io
+import json
+import random
+import numpy as np
+import pytest
+import page_rank_local
+from networkx import DiGraph
+from networkx.algorithms.link_analysis.pagerank_alg import _pagerank_python
+from page_rank_complete import MRPageRank
+from edge_to_adjacency import MRPageRank as MREdgeToAdjacency
+
+N_NODES = 30
+DAMPING_FACTOR = 0.85
+
+
+@pytest.fixture(scope='module')
+def edges():
+    """
+    A random graph with dangling nodes and a duplicate edge
+    """
+    rng = random.Random(7)
+    edges = []
+    for source in range(N_NODES):
+        # every 5th node is dangling
+        if source % 5:
+            # and the ring (source, source + 1) connects every node
+            edges.append((source, (source + 1) % N_NODES))
+            edges.extend((source, target) for target in rng.sample(range(N_NODES), rng.randint(1, 3)))
+    edges.append(edges[0])
+    return edges
+
+
+@pytest.fixture(scope='module')
+def graph_path(edges, tmp_path_factory):
+    path = tmp_path_factory.mktemp('graph') / 'graph.txt'
+    write_edges(path, edges, comment='# FromNodeId\tToNodeId')
+    return str(path)
+
+
+def write_edges(path, edges, comment=None):
+    with open(path, 'w') as f:
+        if comment is not None:
+            f.write(comment + '\n')
+        for source, target in edges:
+            f.write('{}\t{}\n'.format(source, target))
+
+
+def run_job(job_class, args):
+    """
+    Runs the job with the inline runner
+
+    :return: the output of the job
+    """
+    job = job_class(['-r', 'inline', '--no-conf'] + list(args))
+    job.sandbox(stdout=io.BytesIO(), stderr=io.BytesIO())
+    job.execute()
+    return job.stdout.getvalue()
+
+
+def run_page_rank(*args, n_nodes=N_NODES):
+    """
+    :return: the page ranks of every node output by page_rank_complete.py, {node id (str): page rank}
+    """
+    page_ranks = {}
+    for line in run_job(MRPageRank, ['--top_n', str(n_nodes)] + list(args)).splitlines():
+        page_rank, node_id = line.split(b'\t')
+        page_ranks[str(json.loads(node_id))] = json.loads(page_rank)
+    assert len(page_ranks) == n_nodes
+    return page_ranks
+
+
+def local_page_rank(edges, n_iterations, tolerance=None):
+    """
+    :return: the page ranks computed by page_rank_local.py, {node id (str): page rank}
+    """
+    sources, targets = np.array(edges).T
+    graph = page_rank_local.Graph(sources, targets)
+    ranks = page_rank_local.page_rank(graph, n_iterations, DAMPING_FACTOR, tolerance=tolerance)
+    return {str(node_id): rank for node_id, rank in zip(graph.node_ids.tolist(), ranks.tolist())}
+
+
+def l1(page_ranks, expected):
+    assert page_ranks.keys() == expected.keys()
+    return sum(abs(page_ranks[node_id] - expected[node_id]) for node_id in expected)
+
+
+@pytest.fixture(scope='module')
+def converged(edges):
+    return local_page_rank(edges, 1000, tolerance=1e-14)
+
+
+@pytest.mark.parametrize('args', [
+    [],
+    ['--fused'],
+    ['--schimmy'],
+    ['--schimmy', '--fused'],
+    ['--node_protocol', 'packed'],
+    ['--node_protocol', 'varint', '--fused'],
+    ['--n_nodes', str(N_NODES)],
+])
+def test_iterations(graph_path, edges, args):
+    page_ranks = run_page_rank(graph_path, '--n_iterations', '5', *args)
+    assert l1(page_ranks, local_page_rank(edges, 5)) < 1e-12
+
+
+@pytest.mark.parametrize('args', [[], ['--fused']])
+def test_tolerance(graph_path, converged, args):
+    page_ranks = run_page_rank(graph_path, '--n_iterations', '100', '--tolerance', '1e-6', *args)
+    assert l1(page_ranks, converged) < 1e-5
+
+
+def test_blocks(graph_path, converged):
+    page_ranks = run_page_rank(graph_path, '--n_iterations', '50', '--tolerance', '1e-9',
+                               '--block_size', '8', '--block_partitioner', 'hash')
+    assert l1(page_ranks, converged) < 1e-8
+
+
+def test_adaptive(graph_path, converged):
+    page_ranks = run_page_rank(graph_path, '--n_iterations', '100', '--freeze_tolerance', '1e-7')
+    assert l1(page_ranks, converged) < 1e-6
+
+
+def test_random_walks(graph_path, converged):
+    page_ranks = run_page_rank(graph_path, '--random_walks', '300')
+    assert l1(page_ranks, converged) < 0.1
+
+
+def test_seeds(graph_path, edges, tmp_path):
+    seed_sets = [['1', '2'], ['7']]
+    seeds_path = tmp_path / 'seeds.txt'
+    seeds_path.write_text(''.join(' '.join(seeds) + '\n' for seeds in seed_sets))
+    output = run_job(MRPageRank, [graph_path, '--seeds', str(seeds_path), '--n_iterations', '100',
+                                  '--tolerance', '1e-10', '--top_n', '3'])
+
+    graph = DiGraph()
+    graph.add_nodes_from(str(node_id) for edge in edges for node_id in edge)
+    graph.add_edges_from((str(source), str(target)) for source, target in edges)
+    top_n = {}
+    for line in output.splitlines():
+        seed_set, page_rank_node = line.split(b'\t')
+        top_n.setdefault(json.loads(seed_set), []).append(json.loads(page_rank_node))
+    for seed_set_index, seeds in enumerate(seed_sets):
+        expected = _pagerank_python(graph, alpha=DAMPING_FACTOR, personalization={seed: 1 for seed in seeds},
+                                    tol=1e-12, max_iter=1000)
+        assert len(top_n[seed_set_index]) == 3
+        for page_rank, node_id in top_n[seed_set_index]:
+            assert page_rank == pytest.approx(expected[str(node_id)], abs=1e-8)
+
+
+def test_graph_output_dir(graph_path, edges, tmp_path):
+    graph_dir = str(tmp_path / 'saved')
+    run_page_rank(graph_path, '--n_iterations', '3', '--graph_output_dir', graph_dir)
+    # the saved page ranks are complete, the next run continues from them
+    page_ranks = run_page_rank('--graph', graph_dir, '--n_iterations', '2', '--fused')
+    assert l1(page_ranks, local_page_rank(edges, 5)) < 1e-12
+
+
+def test_edge_to_adjacency_graph(graph_path, edges, tmp_path):
+    graph_dir = str(tmp_path / 'graph')
+    run_job(MREdgeToAdjacency, [graph_path, '--node_protocol', 'packed', '--output-dir', graph_dir])
+    page_ranks = run_page_rank('--graph', graph_dir, '--n_iterations', '5', '--schimmy')
+    assert l1(page_ranks, local_page_rank(edges, 5)) < 1e-12
+
+
+def test_previous_graph(graph_path, edges, tmp_path):
+    graph_dir = str(tmp_path / 'saved')
+    run_page_rank(graph_path, '--n_iterations', '3', '--graph_output_dir', graph_dir)
+    changes = [(0, 29), (29, 0), (30, 1)]
+    changes_path = tmp_path / 'changes.txt'
+    write_edges(changes_path, changes)
+    with open(changes_path, 'a') as f:
+        f.write('-{}\t{}\n'.format(*edges[1]))
+
+    page_ranks = run_page_rank(str(changes_path), '--previous_graph', graph_dir, '--n_iterations', '100',
+                               '--tolerance', '1e-12', '--fused', n_nodes=N_NODES + 1)
+    # node 30 is new, the edge of the first line is removed
+    updated_edges = [edge for edge in edges if edge != edges[1]] + changes
+    assert l1(page_ranks, local_page_rank(updated_edges, 1000, tolerance=1e-14)) < 1e-9
+
+
+def test_relative_graph_with_schimmy(graph_path, edges, tmp_path, monkeypatch):
+    run_job(MREdgeToAdjacency, [graph_path, '--output-dir', str(tmp_path / 'graph')])
+    # the tasks don't run in the working directory of the driver
+    monkeypatch.chdir(tmp_path)
+    page_ranks = run_page_rank('--graph', 'graph', '--n_iterations', '5', '--schimmy')
+    assert l1(page_ranks, local_page_rank(edges, 5)) < 1e-12
+
+
+def test_graph_output_dir_of_blocks_with_schimmy(graph_path, edges, tmp_path):
+    graph_dir = str(tmp_path / 'saved')
+    run_page_rank(graph_path, '--n_iterations', '2', '--block_size', '8', '--block_partitioner', 'hash',
+                  '--graph_output_dir', graph_dir)
+    # the blocks output the nodes in any order, the saved parts are sorted like the shuffle anyway
+    run_page_rank('--graph', graph_dir, '--n_iterations', '2', '--schimmy')
+
+
+def test_previous_graph_with_comments(graph_path, edges, tmp_path):
+    graph_dir = str(tmp_path / 'saved')
+    run_page_rank(graph_path, '--n_iterations', '3', '--graph_output_dir', graph_dir)
+    changes_path = tmp_path / 'changes.txt'
+    write_edges(changes_path, [(0, 29)], comment='# added edges')
+    page_ranks = run_page_rank(str(changes_path), '--previous_graph', graph_dir, '--n_iterations', '100',
+                               '--tolerance', '1e-12', '--fused')
+    assert l1(page_ranks, local_page_rank(edges + [(0, 29)], 1000, tolerance=1e-14)) < 1e-9
+
+
+def test_previous_graph_with_invalid_line(graph_path, tmp_path):
+    graph_dir = str(tmp_path / 'saved')
+    run_page_rank(graph_path, '--n_iterations', '3', '--graph_output_dir', graph_dir)
+    changes_path = tmp_path / 'changes.txt'
+    changes_path.write_text('0 29\n')
+    with pytest.raises(ValueError, match='neither an edge change'):
+        run_page_rank(str(changes_path), '--previous_graph', graph_dir, '--n_iterations', '2')
+
+
+@pytest.mark.parametrize('node_protocol', ['json', 'packed', 'varint'])
+def test_top_n_node_ids_are_strings(graph_path, node_protocol):
+    output = run_job(MRPageRank, [graph_path, '--n_iterations', '2', '--top_n', '5', '--node_protocol', node_protocol])
+    node_ids = [json.loads(line.split(b'\t')[1]) for line in output.splitlines()]
+    assert len(node_ids) == 5
+    assert all(isinstance(node_id, str) for node_id in node_ids)
+
+
+@pytest.mark.parametrize('args', [
+    ['--block_size', '8'],
+    ['--freeze_tolerance', '1e-7'],
+    ['--seeds', 'seeds.txt'],
+    ['--random_walks', '10'],
+])
+def test_fused_rejects_other_modes(graph_path, args):
+    with pytest.raises(ValueError, match='not supported with --fused'):
+        run_job(MRPageRank, [graph_path, '--fused'] + args)
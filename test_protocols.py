@@ -0,0 +1,56 @@
+"""
+Round trips of every tag of the packed and varint node protocols (see protocols.py), no data needed:
+    python -m pytest test_protocols.py
+"""
+import pytest
+from protocols import PackedNodeProtocol, VarintNodeProtocol
+
+OUT_LINKS = [7, 3, 300, 70000, 0, 2 ** 31 - 1]
+
+VALUES = [
+    ('c', 0.125),
+    ('v', [0.5, 0.25, 1e-300]),
+    ('n', {'out_links': OUT_LINKS, 'page_rank': 0.1}),
+    ('n', {'out_links': [], 'page_rank': 0.0}),
+    ('m', {'out_links': OUT_LINKS, 'page_rank': 0.1, 'previous_page_rank': 0.2}),
+    ('a', {'out_links': OUT_LINKS, 'page_rank': 0.1, 'previous_page_rank': 0.2, 'frozen_page_rank': 0.3}),
+    ('p', {'out_links': OUT_LINKS, 'page_rank': [0.1, 0.2, 0.3]}),
+    ('j', ['node', 5, {'out_links': [1], 'page_rank': 0.5}]),
+    ('j', {'out_links': [1, 2], 'page_rank': 1}),
+    ('j', []),
+]
+
+
+def sorted_out_links(value):
+    """
+    :return: the value with sorted out links, as the varint protocol sorts them
+    """
+    if isinstance(value, dict) and 'out_links' in value:
+        return dict(value, out_links=sorted(value['out_links']))
+    return value
+
+
+@pytest.mark.parametrize('tag, value', VALUES)
+def test_packed_round_trip(tag, value):
+    protocol = PackedNodeProtocol()
+    line = protocol.write(42, value)
+    assert line.split(b'\t')[1][:1] == tag.encode('utf_8')
+    assert protocol.read(line) == (42, value)
+
+
+@pytest.mark.parametrize('tag, value', VALUES)
+def test_varint_round_trip(tag, value):
+    protocol = VarintNodeProtocol()
+    line = protocol.write(42, value)
+    assert line.split(b'\t')[1][:1] == tag.encode('utf_8')
+    assert protocol.read(line) == (42, sorted_out_links(value))
+
+
+def test_varint_is_smaller_for_close_out_links():
+    node = {'out_links': list(range(1000, 1100)), 'page_rank': 0.1}
+    assert len(VarintNodeProtocol().write(1, node)) < len(PackedNodeProtocol().write(1, node))
+
+
+def test_string_keys_are_written_as_integers():
+    protocol = PackedNodeProtocol()
+    assert protocol.read(protocol.write('17', 0.5)) == (17, 0.5)
@@ -0,0 +1,46 @@
+"""
+Checks that the tokenizer (see tokenizer.py) gives the same words as the regex pipeline the bigram jobs used before,
+no data needed:
+    python -m pytest test_tokenizer.py
+"""
+import re
+import pytest
+from tokenizer import bigrams, words
+
+DOCUMENTS = [
+    'Hello world',
+    "I don't know, what's   THAT?!",
+    '  leading and trailing spaces  ',
+    'tabs\tand\nnew lines',
+    'numbers 123 and l33t sp34k',
+    "it's O'Neil's 'quoted' word",
+    'café naïve über',
+    '...',
+    '---a---',
+]
+
+
+def old_words(content):
+    """
+    The tokenizing of the bigram jobs before tokenizer.py
+    """
+    return re.sub(r'\s+', ' ', re.sub('[^a-z]+', ' ', re.sub('\'', '', content.lower()))).strip(' ').split(' ')
+
+
+@pytest.mark.parametrize('content', DOCUMENTS)
+def test_same_words_as_the_old_regex_pipeline(content):
+    expected = [word for word in old_words(content) if word]
+    assert words(content) == expected
+
+
+@pytest.mark.parametrize('content', DOCUMENTS)
+def test_same_bigrams_as_the_old_regex_pipeline(content):
+    expected = [word for word in old_words(content) if word]
+    assert list(bigrams(content)) == list(zip(expected, expected[1:]))
+
+
+def test_empty_document_has_no_words():
+    # the old pipeline gave a single empty word
+    assert old_words('') == ['']
+    assert words('') == []
+    assert list(bigrams('')) == []
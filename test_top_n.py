@@ -0,0 +1,35 @@
+"""
+The helpers of the top N step (see top_n.py), no data needed:
+    python -m pytest test_top_n.py
+"""
+import heapq
+import random
+import pytest
+from top_n import descending_key, push_bounded, use_sort
+
+
+def test_descending_key_sorts_by_descending_page_rank():
+    page_ranks = [0.0, 5e-324, 1e-300, 1e-10, 0.001, 0.0011, 0.5, 1.0, 3.0]
+    keys = [descending_key(page_rank) for page_rank in page_ranks]
+    assert all(len(key) == 16 for key in keys)
+    # the shuffle sorts the keys as bytes
+    assert sorted(keys, key=lambda key: key.encode('ascii')) == keys[::-1]
+
+
+def test_descending_key_of_equal_page_ranks():
+    assert descending_key(0.25) == descending_key(0.25)
+
+
+@pytest.mark.parametrize('n', [0, 1, 5, 100])
+def test_push_bounded_keeps_the_n_largest(n):
+    rng = random.Random(n)
+    items = [(rng.random(), str(node_id)) for node_id in range(50)]
+    heap = []
+    for item in items:
+        push_bounded(heap, item, n)
+    assert sorted(heap, reverse=True) == heapq.nlargest(n, items)
+
+
+def test_use_sort():
+    assert not use_sort(10, 1000)
+    assert use_sort(101, 1000)
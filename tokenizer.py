@@ -0,0 +1,34 @@
+"""
+Tokenizer shared by the bigram jobs (and test_bigrams.py).
+
+Lower cases the text, removes apostrophes ("don't" -> "dont") and splits it into runs of the letters a-z,
+everything else separates the words. An empty document has no words.
+"""
+import re
+
+WORD = re.compile('[a-z]+')
+REMOVE_APOSTROPHES = str.maketrans('', '', '\'')
+
+
+def words(content):
+    """
+    :param content: the raw content of the document
+    :return: list of words
+    """
+    return WORD.findall(content.lower().translate(REMOVE_APOSTROPHES))
+
+
+def bigrams(content):
+    """
+    Lazily yields every word together with it's following word (without building the list of words),
+    the last word is ignored as it has no following word.
+
+    :param content: the raw content of the document
+    :return: iterator of (word, following_word)
+    """
+    previous_word = None
+    for match in WORD.finditer(content.lower().translate(REMOVE_APOSTROPHES)):
+        word = match.group()
+        if previous_word is not None:
+            yield previous_word, word
+        previous_word = word
@@ -0,0 +1,202 @@
+"""
+Helpers for the final top N step of the page rank jobs.
+
+- small N: every mapper and the reducer keep a bounded min heap of the N largest (page rank, node id) pairs
+- N close to the number of nodes: the pairs are sorted by the shuffle itself (descending_key)
+    over any number of reducers, each reducer outputs a sorted part
+
+Either way, every part of the output is sorted by descending page rank,
+so the parts are merged in a streaming fashion when the output is printed (cat_top_n).
+
+The page rank jobs share the top N step through TopNMixin.
+"""
+from mrjob.job import MRStep
+from mrjob.protocol import JSONProtocol
+from mrjob.util import to_lines
+import heapq
+import itertools
+import posixpath
+import struct
+
+# above this fraction of the nodes, the pairs are sorted by the shuffle instead of being kept in heaps
+SORT_FRACTION = 0.1
+
+FLOAT_BITS = struct.Struct('>d')
+UINT64 = struct.Struct('>Q')
+
+
+def use_sort(top_n, n_nodes):
+    """
+    :return: whether the top N should be sorted by the shuffle instead of kept in bounded heaps
+    """
+    return top_n > n_nodes * SORT_FRACTION
+
+
+def push_bounded(heap, item, n):
+    """
+    Pushes the item to the min heap, keeping only the n largest items
+
+    :param heap: list used as a min heap
+    :param item: (page rank, node id)
+    :param n: maximal size of the heap
+    :return:
+    """
+    if len(heap) < n:
+        heapq.heappush(heap, item)
+    elif n > 0:
+        heapq.heappushpop(heap, item)
+
+
+def descending_key(page_rank):
+    """
+    A fixed width key that sorts (as bytes, like the shuffle) by descending page rank,
+    based on the bits of the (non-negative) float which sort in the same order as the float.
+
+    :param page_rank: page rank
+    :return: 16 hex digits
+    """
+    bits = UINT64.unpack(FLOAT_BITS.pack(page_rank))[0]
+    return '{:016x}'.format(0xffffffffffffffff - bits)
+
+
+class TopNMixin(object):
+    """
+    Mixin for the page rank jobs (class MRPageRank(TopNMixin, CountersMixin, MRJob)) with --top_n and --n_nodes:
+    the top N step is top_n_steps, the nodes are ranked by top_n_page_rank.
+    """
+
+    def topN_mapper_init(self):
+        """
+        Keeps the N largest (page rank, node id) pairs received in the mapper in a bounded min heap
+
+        :return:
+        """
+        self.values = []
+
+    def topN_mapper(self, node_id, node):
+        """
+        Reverts the order so that page ranks are keys. The node id is output as a string,
+        whatever the --node_protocol read it as (the packed protocols give integers).
+
+        If the top N is sorted by the shuffle (see use_sort), the pairs are emitted right away
+        with a key which sorts by descending page rank. Otherwise they're kept in the bounded heap.
+
+        :param node_id:
+        :param node:
+        :return:
+        """
+        page_rank = self.top_n_page_rank(node)
+        node_id = str(node_id)
+        if self.sort_top_n():
+            yield descending_key(page_rank), [page_rank, node_id]
+        else:
+            push_bounded(self.values, (page_rank, node_id), self.options.top_n)
+
+    def top_n_page_rank(self, node):
+        """
+        :param node: node structure
+        :return: the page rank the nodes are ranked by
+        """
+        return node['page_rank']
+
+    def topN_mapper_final(self):
+        """
+        Returns N largest values based on page rank as (page rank, node id)
+
+        :return:
+        """
+        for pair in sorted(self.values, reverse=True):
+            yield pair
+
+    def topN_reducer_init(self):
+        """
+        Keeps the N largest pairs in a bounded min heap, or counts the pairs output when they are sorted by the shuffle
+
+        :return:
+        """
+        self.values = []
+        self.n_output = 0
+
+    def topN_reducer(self, key, values):
+        """
+        Outputs the top N nodes along with their page ranks
+
+        :param key: page rank, or the sort key if the top N is sorted by the shuffle
+        :param values: node ids, or (page rank, node id) if the top N is sorted by the shuffle
+        :return:
+        """
+        if self.sort_top_n():
+            for page_rank, node_id in values:
+                if self.n_output < self.options.top_n:
+                    self.n_output += 1
+                    yield page_rank, node_id
+        else:
+            for node_id in values:
+                push_bounded(self.values, (key, node_id), self.options.top_n)
+
+    def topN_reducer_final(self):
+        """
+        Returns N largest values based on page rank as (page rank, node id)
+
+        :return:
+        """
+        for pair in sorted(self.values, reverse=True):
+            yield pair
+
+    def sort_top_n(self):
+        """
+        :return: whether the top N is sorted by the shuffle over many reducers instead of using bounded heaps
+        """
+        return use_sort(self.options.top_n, self.options.n_nodes)
+
+    def top_n_jobconf(self):
+        """
+        With the bounded heaps, a single reducer merges the heaps of the mappers,
+        when sorted by the shuffle the pairs are spread over all reducers.
+
+        :return:
+        """
+        if self.sort_top_n():
+            return {}
+        return {'mapred.reduce.tasks': 1}
+
+    def top_n_steps(self):
+        """
+        With the bounded heaps, a single reducer merges the heaps of the mappers.
+        When sorted by the shuffle, the pairs are spread over all reducers, each of them outputs
+        a sorted part of its first N pairs (see cat_top_n).
+
+        :return: the steps of the top N
+        """
+        return [MRStep(mapper_init=self.topN_mapper_init,
+                       mapper=self.topN_mapper,
+                       mapper_final=self.topN_mapper_final,
+                       reducer_init=self.topN_reducer_init,
+                       reducer=self.topN_reducer,
+                       reducer_final=self.topN_reducer_final,
+                       jobconf=self.top_n_jobconf())]
+
+
+def cat_top_n(runner, top_n, stream):
+    """
+    Merges the sorted parts of the output of the top N step and writes the first N lines
+
+    :param runner: the runner which ran the top N step
+    :param top_n: number of lines to output
+    :param stream: binary stream to write to
+    :return:
+    """
+    protocol = JSONProtocol()
+    output_dir = runner.get_output_dir()
+
+    def read_part(path):
+        for line in to_lines(runner.fs.cat(path)):
+            line = line.rstrip(b'\r\n')
+            if line:
+                yield protocol.read(line)[0], line
+
+    paths = sorted(path for path in runner.fs.ls(output_dir) if posixpath.basename(path).startswith('part-'))
+    merged = heapq.merge(*[read_part(path) for path in paths], key=lambda record: -record[0])
+    for page_rank, line in itertools.islice(merged, top_n):
+        stream.write(line + b'\n')
+    stream.flush()
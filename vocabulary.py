@@ -0,0 +1,138 @@
+"""
+Builds the vocabulary used by the bigram jobs with --vocabulary:
+every word of the corpus ranked by it's frequency, one word per line (the line number is the id of the word).
+
+Usage:
+    python vocabulary.py data/shortjokes.csv > vocabulary.txt
+    python bigram_prob_pairs.py data/shortjokes.csv --vocabulary vocabulary.txt
+
+The bigram jobs then shuffle the (short, as the most frequent words get the smallest ids) integer ids
+instead of the words, and only decode them when writing the output.
+"""
+from mrjob.job import MRJob, MRStep
+from mrjob.protocol import RawValueProtocol
+from collections import Counter
+from tokenizer import bigrams, words
+
+
+class Vocabulary(object):
+    """
+    The vocabulary written by MRVocabulary, loaded by the bigram jobs
+    """
+
+    def __init__(self, path):
+        with open(path) as f:
+            self.words = [line.rstrip('\n') for line in f]
+        self.word_ids = {word: str(word_id) for word_id, word in enumerate(self.words)}
+
+    def bigrams(self, content):
+        """
+        Same as tokenizer.bigrams, with the ids of the words
+
+        :param content: the raw content of the document
+        :return: iterator of (word id, following word id)
+        """
+        try:
+            word_ids = [self.word_ids[word] for word in words(content)]
+        except KeyError as e:
+            raise ValueError('Word {} is not in the vocabulary, '
+                             'it has to be built from the same input'.format(e.args[0]))
+        return zip(word_ids, word_ids[1:])
+
+    def word(self, word_id):
+        """
+        :param word_id: id of the word (as a string, like in the shuffle)
+        :return: the word
+        """
+        return self.words[int(word_id)]
+
+
+class VocabularyMixin(object):
+    """
+    Mixin for the bigram jobs (class MRWordBigramProb(VocabularyMixin, MRJob)) with a --vocabulary file argument:
+    call load_vocabulary in the task's init, then document_bigrams to tokenize and decode_word to output the words.
+    """
+
+    def load_vocabulary(self):
+        """
+        Loads the --vocabulary, if given
+
+        :return:
+        """
+        self.vocabulary = Vocabulary(self.options.vocabulary) if self.options.vocabulary else None
+
+    def document_bigrams(self, content):
+        """
+        :param content: the raw content of the document
+        :return: the bigrams of the document, as ids of the words if there is a vocabulary
+        """
+        if self.vocabulary is None:
+            return bigrams(content)
+        return self.vocabulary.bigrams(content)
+
+    def decode_word(self, word):
+        """
+        :param word: word, or it's id if there is a vocabulary
+        :return: the word
+        """
+        if self.vocabulary is None:
+            return word
+        return self.vocabulary.word(word)
+
+
+class MRVocabulary(MRJob):
+    FILES = ['tokenizer.py']
+    OUTPUT_PROTOCOL = RawValueProtocol
+
+    def mapper_init(self):
+        """
+        Initialises the counter used for "in-mapper" combining
+
+        :return:
+        """
+        self.word_counts = Counter()
+
+    def mapper(self, joke_id, content):
+        """
+        Counts the words of the joke
+
+        :param joke_id: ignored
+        :param content: the raw content of the document
+        :return:
+        """
+        self.word_counts.update(words(content))
+
+    def mapper_final(self):
+        """
+        Yields the word counts under the same key, so that a single reducer ranks all of the words
+
+        :return: tuples of (None, (word, count))
+        """
+        for word, count in self.word_counts.items():
+            yield None, (word, count)
+
+    def reducer(self, _, word_counts):
+        """
+        Adds up the counts and outputs the words from the most to the least frequent one
+
+        :param _: None
+        :param word_counts: (word, count) from every mapper
+        :return:
+        """
+        counts = Counter()
+        for word, count in word_counts:
+            counts[word] += count
+        for word, count in sorted(counts.items(), key=lambda word_count: (-word_count[1], word_count[0])):
+            yield None, word
+
+    def steps(self):
+        return [
+            MRStep(mapper_init=self.mapper_init,
+                   mapper=self.mapper,
+                   mapper_final=self.mapper_final,
+                   reducer=self.reducer)
+        ]
+
+
+if __name__ == '__main__':
+    MRVocabulary.run()